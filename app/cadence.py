@@ -0,0 +1,138 @@
+import calendar
+import logging
+import statistics
+import time
+from datetime import datetime, timezone
+
+from utils import offsethandler
+
+logger = logging.getLogger("sonarr_youtubedl")
+
+DAY = 24 * 60 * 60
+
+
+def parse_release(value, date_format):
+    """Returns the unix time of a Sonarr air date or yt-dlp upload date, or None"""
+    try:
+        return calendar.timegm(datetime.strptime(value, date_format).timetuple())
+    except (TypeError, ValueError):
+        return None
+
+
+def release_times(ser, entries, history=20):
+    """Returns the sorted unix times of a series' latest releases
+    - ``ser``: Series, its previous airing counts as a release
+    - ``entries``: indexed playlist entries of the series url, None if unknown
+    - ``history``: number of uploads to learn from
+    """
+    releases = set()
+    for entry in (entries or [])[:history]:
+        uploaded = parse_release(entry.get("upload_date"), "%Y%m%d")
+        if uploaded is not None:
+            releases.add(uploaded)
+    aired = parse_release(ser.previous_airing, "%Y-%m-%dT%H:%M:%SZ")
+    if aired is not None:
+        releases.add(aired)
+    return sorted(releases)
+
+
+class CadenceScheduler(object):
+    """Decides when each series is scanned next from its release pattern.
+
+    The period between releases is the median gap between the latest
+    uploads and Sonarr air dates. Around the next expected release, Sonarr's
+    nextAiring moved by the series offset or else the last release plus the
+    period, a series is scanned every ``interval``. Otherwise it is left
+    alone until that window opens, at most ``max_interval`` at a time. A
+    series without enough history, or with its own scan_interval, is
+    scanned at a fixed rate.
+    """
+
+    def __init__(self, max_interval, adaptive=True, window=0.25):
+        """
+        - ``max_interval``: maximum minutes between scans of a series
+        - ``adaptive``: False to scan every series at the same fixed rate
+        - ``window``: share of the release period scanned often around a release
+        """
+        self.max_interval = max_interval * 60
+        self.adaptive = adaptive
+        self.window = window
+        self.due = {}
+
+    def is_due(self, series_key, now=None):
+        now = time.time() if now is None else now
+        return self.due.get(series_key, 0) <= now
+
+    def next_due(self):
+        """Returns the unix time the next series is due, None if none is known"""
+        return min(self.due.values()) if self.due else None
+
+    def forget(self, series_keys):
+        """Drops the series that are no longer configured"""
+        for series_key in set(self.due) - set(series_keys):
+            del self.due[series_key]
+
+    def expected_release(self, ser, releases, period, now):
+        """Returns the unix time the next episode is expected, None if unknown"""
+        airing = parse_release(ser.next_airing, "%Y-%m-%dT%H:%M:%SZ")
+        if airing is not None:
+            if ser.options.offset is not None:
+                airing = offsethandler(
+                    datetime.fromtimestamp(airing, timezone.utc), ser.options.offset
+                ).timestamp()
+            return airing
+        if period is None:
+            return None
+        expected = releases[-1] + period
+        while expected + self.grace(period) < now:
+            expected += period
+        return expected
+
+    def grace(self, period):
+        # upload dates have no time of day, so keep looking a day after
+        return max(period * self.window, DAY)
+
+    def plan(self, ser, interval, entries=None, waiting=None, now=None):
+        """Schedules the next scan of a series that was just scanned
+        - ``ser``: Series
+        - ``interval``: minutes between scans when a release is expected
+        - ``entries``: indexed playlist entries of the series url
+        - ``waiting``: unix time a missing episode is due to be searched again
+            or a download to be resumed or retried
+        returns:
+            ``due``: unix time of the next scan
+        """
+        now = time.time() if now is None else now
+        interval = interval * 60
+        if ser.options.scan_interval is not None:
+            due = now + int(ser.options.scan_interval) * 60
+            self.due[ser.key] = due
+            return due
+        if not self.adaptive:
+            self.due[ser.key] = now + interval
+            return now + interval
+        releases = release_times(ser, entries)
+        gaps = [b - a for a, b in zip(releases, releases[1:])]
+        period = statistics.median(gaps) if len(gaps) >= 2 else None
+        expected = self.expected_release(ser, releases, period, now)
+        if expected is None:
+            due = now + interval
+        else:
+            lead = period * self.window if period is not None else interval
+            if now < expected - lead:
+                due = min(expected - lead, now + self.max_interval)
+            elif now <= expected + self.grace(period or 0):
+                due = now + interval
+            else:
+                due = now + min(self.max_interval, period or interval)
+        if waiting is not None:
+            due = min(due, waiting)
+        due = max(due, now + interval)
+        self.due[ser.key] = due
+        logger.debug(
+            "%s next scanned in %s minutes, release period %s",
+            ser.title,
+            round((due - now) / 60),
+            "unknown" if period is None else "{:.1f} days".format(period / DAY),
+        )
+        return due
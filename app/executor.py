@@ -0,0 +1,155 @@
+import logging
+import os
+import threading
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import metrics
+from tracing import profiler
+
+logger = logging.getLogger("sonarr_youtubedl")
+
+
+class DownloadExecutor(object):
+    """Thread pool running searches and downloads with concurrency limits.
+
+    A job only starts when a global worker is free and neither its series nor
+    its host already runs as many jobs as allowed. Postprocessing jobs run on
+    their own pool, so FFmpeg work never holds up the network bound jobs.
+    Jobs may submit more jobs, ``join`` waits for all of them. Once the last
+    job of a series is done, ``series_done`` is called with the series id on
+    that job's worker.
+    """
+
+    def __init__(
+        self,
+        workers=1,
+        series_workers=1,
+        host_workers=1,
+        series_done=None,
+        postprocess_workers=None,
+    ):
+        """
+        - ``workers``: maximum number of jobs running at once
+        - ``series_workers``: maximum number of jobs running at once per series
+        - ``host_workers``: maximum number of jobs running at once per host
+        - ``series_done``: callable taking a series id, called once its jobs are done
+        - ``postprocess_workers``: postprocessing jobs running at once, defaults
+            to the number of CPUs
+        """
+        self.workers = workers
+        self.series_workers = series_workers
+        self.host_workers = host_workers
+        self.pool = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="sonarr_youtubedl"
+        )
+        self.condition = threading.Condition()
+        self.pending = deque()
+        self.running = 0
+        self.series_running = Counter()
+        self.host_running = Counter()
+        self.series_outstanding = Counter()
+        self.series_done = series_done
+        self.postprocessing = 0
+        self.postprocess_pool = ThreadPoolExecutor(
+            max_workers=postprocess_workers or os.cpu_count() or 1,
+            thread_name_prefix="sonarr_youtubedl_postprocess",
+        )
+
+    def submit(self, series_id, host, fn, *args):
+        """Queues ``fn(*args)`` for the given series and host
+        returns:
+            ``future``: Future resolved with the job result
+        """
+        future = Future()
+        with self.condition:
+            self.pending.append((series_id, host, fn, args, future))
+            self.series_outstanding[series_id] += 1
+            self._dispatch()
+        return future
+
+    def submit_postprocess(self, series_id, fn, *args):
+        """Queues ``fn(*args)`` on the postprocessing pool for the given series
+        returns:
+            ``future``: Future resolved with the job result
+        """
+        future = Future()
+        with self.condition:
+            self.series_outstanding[series_id] += 1
+            self.postprocessing += 1
+        self.postprocess_pool.submit(self._run_postprocess, series_id, fn, args, future)
+        return future
+
+    def _dispatch(self):
+        """Starts every pending job allowed to run, must hold the condition"""
+        for job in list(self.pending):
+            if self.running >= self.workers:
+                break
+            series_id, host = job[0], job[1]
+            if self.series_running[series_id] >= self.series_workers:
+                continue
+            if self.host_running[host] >= self.host_workers:
+                continue
+            self.pending.remove(job)
+            self.running += 1
+            self.series_running[series_id] += 1
+            self.host_running[host] += 1
+            self.pool.submit(self._run, job)
+        metrics.QUEUE_DEPTH.set(len(self.pending))
+        metrics.JOBS_RUNNING.set(self.running)
+
+    def _call(self, fn, args, future):
+        try:
+            with profiler.profile():
+                result = fn(*args)
+            future.set_result(result)
+        except Exception as e:
+            logger.error("Unexpected error in worker: {}".format(e))
+            future.set_exception(e)
+
+    def _finish(self, series_id):
+        """Calls series_done if this was the last job of the series"""
+        with self.condition:
+            self.series_outstanding[series_id] -= 1
+            done = self.series_outstanding[series_id] == 0
+        if done and self.series_done is not None:
+            try:
+                self.series_done(series_id)
+            except Exception as e:
+                logger.error("Unexpected error finishing series: {}".format(e))
+
+    def _run(self, job):
+        series_id, host, fn, args, future = job
+        try:
+            self._call(fn, args, future)
+        finally:
+            self._finish(series_id)
+            with self.condition:
+                self.running -= 1
+                self.series_running[series_id] -= 1
+                self.host_running[host] -= 1
+                self._dispatch()
+                self.condition.notify_all()
+
+    def _run_postprocess(self, series_id, fn, args, future):
+        try:
+            self._call(fn, args, future)
+        finally:
+            self._finish(series_id)
+            with self.condition:
+                self.postprocessing -= 1
+                self.condition.notify_all()
+
+    def join(self):
+        """Waits until every submitted job, including jobs they submitted, is done"""
+        with self.condition:
+            self.condition.wait_for(
+                lambda: (
+                    not self.pending and self.running == 0 and self.postprocessing == 0
+                )
+            )
+
+    def shutdown(self):
+        self.join()
+        self.pool.shutdown()
+        self.postprocess_pool.shutdown()
@@ -0,0 +1,213 @@
+import logging
+import re
+import threading
+import time
+import urllib.parse
+from contextlib import contextmanager
+
+import metrics
+
+logger = logging.getLogger("sonarr_youtubedl")
+
+# yt-dlp errors of a host refusing requests because there were too many
+THROTTLING = re.compile(
+    r"HTTP Error 429|Too Many Requests|confirm you.re not a bot|rate.limited"
+    r"|try again later",
+    re.IGNORECASE,
+)
+# longest pause after throttling errors in a row, in seconds
+MAX_COOLDOWN = 60 * 60
+# slowest share of its rate a bucket backs off to
+MIN_FACTOR = 0.05
+
+
+def is_throttling(message):
+    """Returns True if a yt-dlp error ``message`` means the host throttles us"""
+    return THROTTLING.search(str(message)) is not None
+
+
+def request_host(url):
+    """Returns the host a budget of ``url`` is kept for, without www."""
+    host = urllib.parse.urlparse(url).hostname or ""
+    return host[4:] if host.startswith("www.") else host
+
+
+class TokenBucket(object):
+    """Budget of ``rate`` requests per minute with bursts of up to ``burst``.
+
+    The rate is slowed by ``factor`` while the host throttles us. Every
+    throttling error slows it down by ``backoff`` and pauses the bucket for
+    ``cooldown`` seconds, doubled for each error in a row, and every
+    successful request speeds it up again by ``recovery``.
+    """
+
+    def __init__(self, rate, burst):
+        """
+        - ``rate``: requests per minute
+        - ``burst``: requests made at once after a quiet period
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.factor = 1.0
+        self.paused_until = 0
+        self.strikes = 0
+
+    def refill(self, now):
+        elapsed = now - max(self.updated, self.paused_until)
+        if elapsed > 0:
+            self.tokens = min(
+                self.burst, self.tokens + elapsed * self.rate * self.factor / 60
+            )
+        self.updated = max(now, self.updated)
+
+    def reserve(self, now):
+        """Takes a token
+        returns:
+            ``wait``: seconds to wait before the request is in budget
+        """
+        self.refill(now)
+        self.tokens -= 1
+        wait = max(self.paused_until - now, 0)
+        if self.tokens < 0:
+            wait += -self.tokens * 60 / (self.rate * self.factor)
+        return wait
+
+    def throttled(self, now, backoff, cooldown):
+        self.refill(now)
+        self.strikes += 1
+        self.factor = max(self.factor * backoff, MIN_FACTOR)
+        self.tokens = min(self.tokens, 0)
+        pause = min(cooldown * 2 ** (self.strikes - 1), MAX_COOLDOWN)
+        self.paused_until = max(self.paused_until, now + pause)
+        return pause
+
+    def succeeded(self, recovery):
+        self.strikes = 0
+        self.factor = min(self.factor + recovery, 1.0)
+
+
+class RateGovernor(object):
+    """Paces the playlist listings, searches and downloads of every series.
+
+    Each request takes a token from the bucket of its host, shared by every
+    series, and from the bucket of the cookie file it is made with, as the
+    host may limit an account as well as an address. Budgets are configured
+    per host and per cookie file, the others use the default. Throttling
+    errors, HTTP 429 or a bot check, slow the buckets of the request down
+    and successful requests let them recover gradually.
+    """
+
+    def __init__(
+        self,
+        rate=30,
+        burst=5,
+        hosts=None,
+        cookies=None,
+        backoff=0.5,
+        recovery=0.05,
+        cooldown=60,
+    ):
+        """
+        - ``rate``: default requests per minute
+        - ``burst``: default requests made at once after a quiet period
+        - ``hosts``: dict of host to a (rate, burst) tuple
+        - ``cookies``: dict of cookie file path to a (rate, burst) tuple
+        - ``backoff``: factor the rate is slowed by per throttling error
+        - ``recovery``: share of the rate regained per successful request
+        - ``cooldown``: seconds requests pause after a throttling error
+        """
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.backoff = backoff
+        self.recovery = recovery
+        self.cooldown = cooldown
+        self.set_budgets(rate, burst, hosts, cookies)
+
+    def set_budgets(self, rate, burst, hosts=None, cookies=None):
+        """Applies new budgets, keeping how far each bucket backed off"""
+        with self.lock:
+            self.rate = rate
+            self.burst = burst
+            self.budgets = {"host": hosts or {}, "cookies": cookies or {}}
+            for (kind, name), bucket in self.buckets.items():
+                bucket.rate, bucket.burst = self.budget(kind, name)
+
+    def budget(self, kind, name):
+        return self.budgets[kind].get(name, (self.rate, self.burst))
+
+    def bucket(self, kind, name):
+        key = (kind, name)
+        if key not in self.buckets:
+            self.buckets[key] = TokenBucket(*self.budget(kind, name))
+        return self.buckets[key]
+
+    def keys(self, host, cookiefile):
+        keys = [("host", host)]
+        if cookiefile is not None:
+            keys.append(("cookies", cookiefile))
+        return keys
+
+    def acquire(self, host, cookiefile=None):
+        """Waits until a request to ``host`` with ``cookiefile`` is in budget
+        returns:
+            ``wait``: seconds waited
+        """
+        now = time.monotonic()
+        with self.lock:
+            wait = max(
+                self.bucket(*key).reserve(now) for key in self.keys(host, cookiefile)
+            )
+        if wait > 0:
+            logger.debug("Waiting %.1f seconds for the %s request budget", wait, host)
+            metrics.RATE_LIMIT_WAIT.inc(wait, host=host)
+            time.sleep(wait)
+        return wait
+
+    def throttled(self, host, cookiefile=None):
+        """Slows the requests to ``host`` and with ``cookiefile`` down"""
+        now = time.monotonic()
+        with self.lock:
+            for key in self.keys(host, cookiefile):
+                bucket = self.bucket(*key)
+                pause = bucket.throttled(now, self.backoff, self.cooldown)
+                logger.warning(
+                    "Throttled by {}, pausing {} {} for {} seconds then slowing "
+                    "to {:.1f} requests per minute".format(
+                        host,
+                        key[0],
+                        key[1],
+                        round(pause),
+                        bucket.rate * bucket.factor,
+                    )
+                )
+        metrics.THROTTLED.inc(host=host)
+
+    def succeeded(self, host, cookiefile=None):
+        with self.lock:
+            for key in self.keys(host, cookiefile):
+                self.bucket(*key).succeeded(self.recovery)
+
+    @contextmanager
+    def request(self, url, cookiefile=None, ydl_logger=None):
+        """Waits for the budget of a request to ``url``, then runs the block and
+        backs off if it hit a throttling error
+        - ``url``: url the request is made to
+        - ``cookiefile``: cookie file the request is made with
+        - ``ydl_logger``: YoutubeDLLogger of the request, with the errors
+            yt-dlp reported without raising
+        """
+        host = request_host(url)
+        self.acquire(host, cookiefile)
+        try:
+            yield
+        except Exception as e:
+            if is_throttling(e):
+                self.throttled(host, cookiefile)
+            raise
+        reported = ydl_logger.reported if ydl_logger is not None else []
+        if any(is_throttling(message) for message in reported):
+            self.throttled(host, cookiefile)
+        else:
+            self.succeeded(host, cookiefile)
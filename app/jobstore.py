@@ -0,0 +1,192 @@
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger("sonarr_youtubedl")
+
+WANTED = "wanted"
+MATCHED = "matched"
+DOWNLOADING = "downloading"
+POSTPROCESSING = "postprocessing"
+DOWNLOADED = "downloaded"
+IMPORTED = "imported"
+FAILED = "failed"
+
+# states of a job whose video url is known and still has to be downloaded
+RESUMABLE = [MATCHED, DOWNLOADING, POSTPROCESSING]
+
+
+class JobStore(object):
+    """SQLite record of every wanted episode and how far its download got.
+
+    An episode is wanted until a search matches it to a video, then matched,
+    downloading, postprocessing and downloaded, and imported once Sonarr no
+    longer lists it as missing. A job left matched, downloading or
+    postprocessing by a restart is resumed with its stored url, yt-dlp
+    continuing the partial file. A job is failed once its download failed
+    ``max_attempts`` times, and only downloaded again if a search matches
+    the episode to another video.
+    """
+
+    def __init__(self, db_file):
+        """
+        - ``db_file``: path of the SQLite database holding the jobs
+        """
+        self.db_file = db_file
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(
+            db_file, check_same_thread=False, isolation_level=None
+        )
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " series_id INTEGER NOT NULL,"
+            " episode_id INTEGER NOT NULL,"
+            " series_title TEXT,"
+            " episode_title TEXT,"
+            " state TEXT NOT NULL,"
+            " url TEXT,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " error TEXT,"
+            " updated REAL NOT NULL,"
+            " PRIMARY KEY (series_id, episode_id))"
+        )
+
+    def execute(self, sql, params=()):
+        with self.lock:
+            return self.db.execute(sql, params).fetchall()
+
+    def get(self, series_id, episode_id):
+        rows = self.execute(
+            "SELECT * FROM jobs WHERE series_id = ? AND episode_id = ?",
+            (series_id, episode_id),
+        )
+        return dict(rows[0]) if rows else None
+
+    def resumable(self, series_id):
+        """Returns a dict of episode id to the job of every download to resume"""
+        rows = self.execute(
+            "SELECT * FROM jobs WHERE series_id = ? AND url IS NOT NULL"
+            " AND state IN ({})".format(", ".join("?" for _ in RESUMABLE)),
+            [series_id] + RESUMABLE,
+        )
+        return {row["episode_id"]: dict(row) for row in rows}
+
+    def next_retry(self, series_id):
+        """Returns the unix time a download of a series to resume or retry is
+        due, None if there is none. Unfinished and failed attempts are due
+        again as soon as they stopped.
+        """
+        rows = self.execute(
+            "SELECT MIN(updated) AS due FROM jobs WHERE series_id = ?"
+            " AND url IS NOT NULL AND state IN ({})".format(
+                ", ".join("?" for _ in RESUMABLE)
+            ),
+            [series_id] + RESUMABLE,
+        )
+        return rows[0]["due"]
+
+    def wanted(self, ser, eps):
+        """Records an episode a search did not find"""
+        self.execute(
+            "INSERT INTO jobs (series_id, episode_id, series_title, episode_title,"
+            " state, updated) VALUES (?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT (series_id, episode_id) DO UPDATE SET"
+            " episode_title = excluded.episode_title, updated = excluded.updated",
+            (ser.id, eps.id, ser.title, eps.title, WANTED, time.time()),
+        )
+
+    def matched(self, ser, eps, url):
+        """Records the video a search matched an episode to
+        returns:
+            ``bool``: False if downloading ``url`` already failed too often
+        """
+        job = self.get(ser.id, eps.id)
+        if job is not None and job["state"] == FAILED and job["url"] == url:
+            return False
+        self.execute(
+            "INSERT OR REPLACE INTO jobs (series_id, episode_id, series_title,"
+            " episode_title, state, url, attempts, updated)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                ser.id,
+                eps.id,
+                ser.title,
+                eps.title,
+                MATCHED,
+                url,
+                job["attempts"] if job is not None and job["url"] == url else 0,
+                time.time(),
+            ),
+        )
+        return True
+
+    def set_state(self, series_id, episode_id, state, error=None):
+        self.execute(
+            "UPDATE jobs SET state = ?, error = ?, updated = ?"
+            " WHERE series_id = ? AND episode_id = ?",
+            (state, error, time.time(), series_id, episode_id),
+        )
+
+    def start(self, series_id, episode_id):
+        """Records the start of a download attempt"""
+        self.execute(
+            "UPDATE jobs SET state = ?, attempts = attempts + 1, updated = ?"
+            " WHERE series_id = ? AND episode_id = ?",
+            (DOWNLOADING, time.time(), series_id, episode_id),
+        )
+
+    def failed(self, series_id, episode_id, max_attempts, error):
+        """Records a failed download attempt, failing the job after ``max_attempts``"""
+        job = self.get(series_id, episode_id)
+        if job is None:
+            return
+        state = FAILED if job["attempts"] >= max_attempts else MATCHED
+        self.set_state(series_id, episode_id, state, error)
+
+    def postprocessor_hook(self, series_id, episode_id):
+        """Returns a yt-dlp postprocessor hook moving the job to postprocessing"""
+
+        def hook(d):
+            if d["status"] == "started":
+                self.set_state(series_id, episode_id, POSTPROCESSING)
+
+        return hook
+
+    def prune(self, series_id, episode_ids):
+        """Settles the jobs of a series' episodes that are no longer wanted.
+        Downloaded jobs are marked imported, unfinished ones are dropped.
+        """
+        keep = set(episode_ids)
+        for row in self.execute(
+            "SELECT episode_id, state FROM jobs WHERE series_id = ? AND state != ?",
+            (series_id, IMPORTED),
+        ):
+            if row["episode_id"] in keep:
+                continue
+            if row["state"] == DOWNLOADED:
+                self.set_state(series_id, row["episode_id"], IMPORTED)
+            else:
+                self.execute(
+                    "DELETE FROM jobs WHERE series_id = ? AND episode_id = ?",
+                    (series_id, row["episode_id"]),
+                )
+
+    def expire(self, before):
+        """Drops the jobs last updated before the unix time ``before``"""
+        self.execute("DELETE FROM jobs WHERE updated < ?", (before,))
+
+    def counts(self):
+        """Returns a dict of state to number of jobs"""
+        return {
+            row["state"]: row["jobs"]
+            for row in self.execute(
+                "SELECT state, COUNT(*) AS jobs FROM jobs GROUP BY state"
+            )
+        }
+
+    def close(self):
+        with self.lock:
+            self.db.close()
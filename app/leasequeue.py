@@ -0,0 +1,234 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("sonarr_youtubedl")
+
+
+class LeaseLost(Exception):
+    """Raised to stop work on a task whose lease another worker took over"""
+
+
+class LeaseQueue(object):
+    """SQLite queue of series handed from a coordinator to download workers.
+
+    The coordinator puts one task per series with wanted episodes. A worker
+    leases a task for ``lease_seconds`` and renews the lease while it works,
+    so no other worker takes the series over unless the worker holding it
+    stops. A task is gone once its worker completes it. A series already
+    leased is left alone by the coordinator, its episodes are never searched
+    and downloaded twice at once. The coordinator's newer payload of a
+    leased series is kept aside and queued once the worker completes or
+    releases the task.
+
+    The database keeps the default rollback journal, WAL needs shared memory
+    and would not work with workers on other machines sharing the file.
+    """
+
+    def __init__(self, db_file, lease_seconds=300):
+        """
+        - ``db_file``: path of the SQLite database every node shares
+        - ``lease_seconds``: seconds a task is held without a heartbeat
+        """
+        self.db_file = db_file
+        self.lease_seconds = lease_seconds
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(
+            db_file, timeout=30, check_same_thread=False, isolation_level=None
+        )
+        self.db.row_factory = sqlite3.Row
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            " instance TEXT NOT NULL,"
+            " series_id INTEGER NOT NULL,"
+            " title TEXT,"
+            " payload TEXT NOT NULL,"
+            " owner TEXT,"
+            " lease_expires REAL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " queued REAL NOT NULL,"
+            " pending_payload TEXT,"
+            " PRIMARY KEY (instance, series_id))"
+        )
+        columns = [row["name"] for row in self.db.execute("PRAGMA table_info(tasks)")]
+        if "pending_payload" not in columns:
+            self.db.execute("ALTER TABLE tasks ADD COLUMN pending_payload TEXT")
+
+    def execute(self, sql, params=()):
+        with self.lock:
+            cursor = self.db.execute(sql, params)
+            return cursor.fetchall(), cursor.rowcount
+
+    def put(self, instance, series_id, title, payload):
+        """Queues a series, replacing its queued task. The payload of a task a
+        worker holds is kept for once the worker is done with it.
+        - ``instance``: name of the Sonarr instance of the series
+        - ``series_id``: Sonarr id of the series
+        - ``title``: series title, for the logs
+        - ``payload``: json serializable description of the work
+        """
+        held = "owner IS NOT NULL AND lease_expires >= :now"
+        self.execute(
+            "INSERT INTO tasks (instance, series_id, title, payload, queued)"
+            " VALUES (:instance, :series_id, :title, :payload, :now)"
+            " ON CONFLICT (instance, series_id) DO UPDATE SET"
+            " title = excluded.title,"
+            " payload = CASE WHEN {held} THEN payload ELSE excluded.payload END,"
+            " pending_payload = CASE WHEN {held} THEN excluded.payload END,"
+            " owner = CASE WHEN {held} THEN owner END,"
+            " lease_expires = CASE WHEN {held} THEN lease_expires END".format(
+                held=held
+            ),
+            {
+                "instance": instance,
+                "series_id": series_id,
+                "title": title,
+                "payload": json.dumps(payload),
+                "now": time.time(),
+            },
+        )
+
+    def discard(self, instance, series_id):
+        """Drops the task of a series that is no longer wanted, once its
+        worker is done with it if held"""
+        now = time.time()
+        self.execute(
+            "DELETE FROM tasks WHERE instance = ? AND series_id = ?"
+            " AND (owner IS NULL OR lease_expires < ?)",
+            (instance, series_id, now),
+        )
+        self.execute(
+            "UPDATE tasks SET pending_payload = NULL"
+            " WHERE instance = ? AND series_id = ?",
+            (instance, series_id),
+        )
+
+    def lease(self, owner):
+        """Leases the longest queued task that no worker holds
+        - ``owner``: id of the worker
+        returns:
+            ``task``: dict with the payload loaded, None if there is no work
+        """
+        now = time.time()
+        with self.lock:
+            # take the write lock first, so two workers can't lease the same task
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.db.execute(
+                    "SELECT * FROM tasks WHERE owner IS NULL OR lease_expires < ?"
+                    " ORDER BY queued LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is not None:
+                    # a payload put while the expired lease was held is newer
+                    self.db.execute(
+                        "UPDATE tasks SET owner = ?, lease_expires = ?,"
+                        " attempts = attempts + 1,"
+                        " payload = COALESCE(pending_payload, payload),"
+                        " pending_payload = NULL"
+                        " WHERE instance = ? AND series_id = ?",
+                        (
+                            owner,
+                            now + self.lease_seconds,
+                            row["instance"],
+                            row["series_id"],
+                        ),
+                    )
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        task = dict(row)
+        task["payload"] = json.loads(task.pop("pending_payload") or task["payload"])
+        if task["owner"] is not None:
+            logger.warning(
+                "Taking over {} from {}, its lease expired".format(
+                    task["title"], task["owner"]
+                )
+            )
+        task["owner"] = owner
+        return task
+
+    def renew(self, task):
+        """Extends the lease of a task
+        returns:
+            ``bool``: False if the worker no longer holds the task
+        """
+        _, updated = self.execute(
+            "UPDATE tasks SET lease_expires = ?"
+            " WHERE instance = ? AND series_id = ? AND owner = ?",
+            (
+                time.time() + self.lease_seconds,
+                task["instance"],
+                task["series_id"],
+                task["owner"],
+            ),
+        )
+        return updated == 1
+
+    def complete(self, task):
+        """Removes a task its worker is done with, or queues it again with the
+        payload the coordinator put while it was held"""
+        self.execute(
+            "DELETE FROM tasks WHERE instance = ? AND series_id = ? AND owner = ?"
+            " AND pending_payload IS NULL",
+            (task["instance"], task["series_id"], task["owner"]),
+        )
+        self.release(task)
+
+    def release(self, task):
+        """Hands a task back to the queue for another worker, with the payload
+        the coordinator put while it was held if any"""
+        self.execute(
+            "UPDATE tasks SET owner = NULL, lease_expires = NULL,"
+            " payload = COALESCE(pending_payload, payload), pending_payload = NULL"
+            " WHERE instance = ? AND series_id = ? AND owner = ?",
+            (task["instance"], task["series_id"], task["owner"]),
+        )
+
+    @contextmanager
+    def holding(self, task):
+        """Renews the lease of ``task`` in the background while the block runs
+        returns:
+            ``lost``: threading.Event set once the lease could not be renewed,
+                the block should stop working on the task
+        """
+        stop = threading.Event()
+        lost = threading.Event()
+
+        def heartbeat():
+            while not stop.wait(self.lease_seconds / 3):
+                try:
+                    if not self.renew(task):
+                        logger.warning("Lost the lease of {}".format(task["title"]))
+                        lost.set()
+                        return
+                except sqlite3.Error as e:
+                    logger.error("Failed to renew lease: {}".format(e))
+
+        thread = threading.Thread(target=heartbeat, name="heartbeat", daemon=True)
+        thread.start()
+        try:
+            yield lost
+        finally:
+            stop.set()
+            thread.join()
+
+    def counts(self):
+        """Returns the number of queued and leased tasks"""
+        rows, _ = self.execute(
+            "SELECT COUNT(*) AS tasks,"
+            " SUM(owner IS NOT NULL AND lease_expires >= ?) AS leased FROM tasks",
+            (time.time(),),
+        )
+        leased = rows[0]["leased"] or 0
+        return {"queued": rows[0]["tasks"] - leased, "leased": leased}
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,119 @@
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("sonarr_youtubedl")
+
+
+class NotFoundLedger(object):
+    """On disk record of the episodes a search did not find.
+
+    Each miss doubles the wait before the episode is searched again, up to a
+    cap. The record is dropped once the episode is found, and reset when its
+    Sonarr title or the series playlist index changes.
+    """
+
+    def __init__(self, ledger_file, backoff, max_backoff):
+        """
+        - ``ledger_file``: path of the json file holding the ledger
+        - ``backoff``: minutes to wait after the first miss
+        - ``max_backoff``: maximum minutes to wait between searches
+        """
+        self.ledger_file = ledger_file
+        self.backoff = backoff * 60
+        self.max_backoff = max_backoff * 60
+        self.lock = threading.Lock()
+        self.records = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.ledger_file):
+            return
+        try:
+            with open(self.ledger_file, "r") as ledgerfile:
+                self.records = json.load(ledgerfile)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable not found ledger: {}".format(e))
+            self.records = {}
+
+    def save(self):
+        with self.lock:
+            records = dict(self.records)
+        tmp_file = self.ledger_file + ".tmp"
+        try:
+            with open(tmp_file, "w") as ledgerfile:
+                json.dump(records, ledgerfile)
+            os.replace(tmp_file, self.ledger_file)
+        except OSError as e:
+            logger.error("Failed to save not found ledger: {}".format(e))
+
+    @staticmethod
+    def key(series_id, episode_id):
+        return "{}:{}".format(series_id, episode_id)
+
+    def should_search(self, series_id, eps, index=None):
+        """Checks if an episode is due to be searched
+        - ``series_id``: id of the episode's series
+        - ``eps``: WantedEpisode
+        - ``index``: signature of the series playlist index, None if unknown
+        returns:
+            ``bool``: False while the episode waits for its next search
+        """
+        key = self.key(series_id, eps.id)
+        with self.lock:
+            record = self.records.get(key)
+            if record is None:
+                return True
+            if record["title"] != eps.title or (
+                index is not None and record["index"] != index
+            ):
+                del self.records[key]
+                return True
+            return time.time() >= record["next_search"]
+
+    def missing(self, series_id, eps, index=None):
+        """Records a search that did not find the episode"""
+        key = self.key(series_id, eps.id)
+        with self.lock:
+            record = self.records.get(key, {"attempts": 0})
+            attempts = record["attempts"] + 1
+            wait = min(self.backoff * 2 ** (attempts - 1), self.max_backoff)
+            self.records[key] = {
+                "title": eps.title,
+                "index": index,
+                "attempts": attempts,
+                "next_search": time.time() + wait,
+            }
+
+    def found(self, series_id, eps):
+        with self.lock:
+            self.records.pop(self.key(series_id, eps.id), None)
+
+    def next_search(self, series_id):
+        """Returns the unix time a missing episode of the series is due, or None"""
+        prefix = self.key(series_id, "")
+        with self.lock:
+            times = [
+                record["next_search"]
+                for key, record in self.records.items()
+                if key.startswith(prefix)
+            ]
+        return min(times) if times else None
+
+    def expire(self, before):
+        """Drops the records due to be searched before the unix time ``before``"""
+        with self.lock:
+            for key, record in list(self.records.items()):
+                if record["next_search"] < before:
+                    del self.records[key]
+
+    def prune(self, series_id, episode_ids):
+        """Drops the records of a series' episodes that are no longer wanted"""
+        prefix = self.key(series_id, "")
+        keep = set(self.key(series_id, episode_id) for episode_id in episode_ids)
+        with self.lock:
+            for key in list(self.records):
+                if key.startswith(prefix) and key not in keep:
+                    del self.records[key]
@@ -0,0 +1,62 @@
+import logging
+import os
+import threading
+
+logger = logging.getLogger("sonarr_youtubedl")
+
+# extension of a finished download, downloads are remuxed into mkv and the
+# webm or mp4 yt-dlp writes before that is not a finished episode yet
+FINAL_EXTENSIONS = {"mkv"}
+
+
+class LibraryIndex(object):
+    """Index of the episode files in the series folders under /sonarr_root.
+
+    Each folder is listed once and listed again only when its mtime changes,
+    a file being added, removed or renamed. An episode is in the library if
+    a remuxed video file has the name get_episode_filename gives it, the file
+    a download writes and Sonarr renames to once it imports it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # folder path to its mtime and dict of file name without extension
+        # to file name
+        self.folders = {}
+
+    def listing(self, folder):
+        """Returns a dict of name without extension to name of the finished
+        video files in ``folder``, empty if it doesn't exist"""
+        try:
+            mtime = os.stat(folder).st_mtime_ns
+        except OSError:
+            with self.lock:
+                self.folders.pop(folder, None)
+            return {}
+        with self.lock:
+            cached = self.folders.get(folder)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        files = {}
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    stem, ext = os.path.splitext(entry.name)
+                    if ext[1:].lower() in FINAL_EXTENSIONS and entry.is_file():
+                        files[stem] = entry.name
+        except OSError as e:
+            logger.error("Failed to list {}: {}".format(folder, e))
+            return {}
+        with self.lock:
+            self.folders[folder] = (mtime, files)
+        logger.debug("Listed %s video files in %s", len(files), folder)
+        return files
+
+    def find(self, filename):
+        """Returns the path of an episode file in the library, None if missing
+        - ``filename``: output template of the episode, ending in .%(ext)s
+        """
+        folder, name = os.path.split(filename)
+        stem = name[: -len(".%(ext)s")] if name.endswith(".%(ext)s") else name
+        found = self.listing(folder).get(stem)
+        return os.path.join(folder, found) if found is not None else None
@@ -0,0 +1,233 @@
+import math
+import re
+from collections import Counter, defaultdict
+
+from cadence import parse_release
+from utils import upperescape
+
+# Characters upperescape makes optional, they are dropped from index tokens
+OPTIONAL_CHARACTERS = re.compile("['’,!.?:]")
+NON_WORD = re.compile(r"[\W_]+")
+NUMBER = re.compile(r"\d+")
+
+# scores this close to the best are ties, settled by the upload date
+TIE_MARGIN = 0.02
+# fewest informative trigrams a title needs to be scored at all
+MIN_GRAMS = 3
+
+
+def normalize_token(token):
+    """Normalizes a space separated title word for the token index
+    - ``token``: word of an episode or video title
+    returns:
+        ``string``: casefolded word without optional punctuation
+    """
+    return OPTIONAL_CHARACTERS.sub("", token.casefold())
+
+
+def anchor_token(title):
+    """Picks the word every title matched by ``upperescape(title)`` must contain.
+    Only words surrounded by spaces qualify, as the first and last words can match
+    inside longer words, and AND is skipped as it also matches an ampersand.
+    - ``title``: episode title
+    returns:
+        ``string``: normalized anchor word, None if the title has none
+    """
+    words = title.replace("“", '"').replace("”", '"').split(" ")[1:-1]
+    tokens = [normalize_token(word) for word in words if word.upper() != "AND"]
+    tokens = [token for token in tokens if token]
+    if not tokens:
+        return None
+    return max(tokens, key=len)
+
+
+class TitleMatcher(object):
+    """Matches all wanted episode titles of a series against video titles in one pass.
+
+    Each episode keeps its upperescape regex, so the matching rules are unchanged,
+    but a regex only runs against the video titles containing its anchor word.
+    """
+
+    def __init__(self, titles):
+        """
+        - ``titles``: dict of episode key to episode title
+        """
+        self.patterns = {}
+        self.index = {}
+        self.unindexed = []
+        for key, title in titles.items():
+            self.patterns[key] = re.compile(upperescape(title), re.IGNORECASE)
+            anchor = anchor_token(title)
+            if anchor is None:
+                self.unindexed.append(key)
+            else:
+                self.index.setdefault(anchor, []).append(key)
+
+    def match(self, entries):
+        """Finds the first entry matching each episode
+        - ``entries``: playlist entries with a title, in search order
+        returns:
+            ``matches``: dict of episode key to the first matching entry
+        """
+        matches = {}
+        for entry in entries:
+            if len(matches) == len(self.patterns):
+                break
+            title = entry["title"]
+            candidates = list(self.unindexed)
+            for token in set(normalize_token(title).split(" ")):
+                candidates.extend(self.index.get(token, []))
+            for key in candidates:
+                if key not in matches and self.patterns[key].search(title):
+                    matches[key] = entry
+        return matches
+
+
+def title_grams(title):
+    """Returns the character trigrams of a title
+    - ``title``: episode or video title
+    returns:
+        ``frozenset``: trigrams of the casefolded words, padded with spaces
+    """
+    text = " {} ".format(NON_WORD.sub(" ", title.casefold()).strip())
+    return frozenset(text[i : i + 3] for i in range(len(text) - 2))
+
+
+class FuzzyMatcher(object):
+    """Scores wanted episode titles against every video title of a series url.
+
+    Titles are compared as sets of character trigrams by cosine similarity,
+    so reworded, reordered or misspelled titles still score high. Trigrams
+    shared by more than ``common`` of the videos, like the channel name or a
+    fixed title format, tell no video apart and are left out. The videos
+    are indexed by trigram and each episode probes the index with its rarest
+    trigrams, enough of them that a video sharing none can't reach the
+    threshold. Of those, videos with too few or too many trigrams to reach
+    it are skipped before scoring, so only a few videos per episode are
+    scored.
+
+    An episode is only matched to a video scoring ``margin`` more than any
+    other, as a title about as similar to two videos matches neither
+    reliably. Videos within TIE_MARGIN of each other are the exception when
+    the one uploaded closest to the air date of the episode settles the tie.
+    """
+
+    def __init__(self, entries, common=0.05, margin=0.05):
+        """
+        - ``entries``: playlist entries with a title and upload_date
+        - ``common``: share of the videos above which a trigram is left out
+        - ``margin``: similarity the match must have over the next best video
+        """
+        self.entries = entries
+        self.margin = margin
+        grams = [title_grams(entry["title"]) for entry in entries]
+        self.frequency = Counter()
+        for entry_grams in grams:
+            self.frequency.update(entry_grams)
+        limit = max(20, len(entries) * common)
+        self.common = frozenset(
+            gram for gram, count in self.frequency.items() if count > limit
+        )
+        self.grams = [entry_grams - self.common for entry_grams in grams]
+        self.index = defaultdict(list)
+        for i, entry_grams in enumerate(self.grams):
+            for gram in entry_grams:
+                self.index[gram].append(i)
+        self.numbers = [set(NUMBER.findall(entry["title"])) for entry in entries]
+
+    def scores(self, title, threshold):
+        """Scores a title against the videos
+        - ``title``: episode title
+        - ``threshold``: lowest similarity of interest, between 0 and 1
+        returns:
+            ``scores``: dict of entry index to similarity, of the videos
+                reaching ``threshold`` and containing every number of the title
+        """
+        grams = title_grams(title) - self.common
+        if len(grams) < MIN_GRAMS:
+            return {}
+        if threshold <= 0:
+            candidates = range(len(self.entries))
+            shortest, longest = 0, float("inf")
+        else:
+            # a video sharing none of the probed trigrams shares too few to score
+            shared = math.ceil(threshold * threshold * len(grams))
+            probe = sorted(grams, key=lambda gram: self.frequency[gram])
+            candidates = set()
+            for gram in probe[: len(grams) - shared + 1]:
+                candidates.update(self.index.get(gram, ()))
+            # the similarity is at most the square root of the size ratio
+            shortest = threshold * threshold * len(grams)
+            longest = len(grams) / (threshold * threshold)
+        numbers = set(NUMBER.findall(title))
+        scores = {}
+        for i in candidates:
+            if not shortest <= len(self.grams[i]) <= longest:
+                continue
+            score = len(grams & self.grams[i]) / math.sqrt(
+                len(grams) * len(self.grams[i])
+            )
+            if score >= threshold and numbers <= self.numbers[i]:
+                scores[i] = score
+        return scores
+
+    def distance(self, i, aired):
+        """Returns the seconds between the upload of a video and the air date,
+        None if either is unknown"""
+        uploaded = parse_release(self.entries[i].get("upload_date"), "%Y%m%d")
+        if aired is None or uploaded is None:
+            return None
+        return abs(uploaded - aired)
+
+    def pick(self, scores, aired, threshold):
+        """Picks the video an episode matches, None if no video reaches
+        ``threshold`` clear of the others
+        - ``scores``: dict of entry index to similarity, of the videos left
+        - ``aired``: unix time the episode aired, None if unknown
+        - ``threshold``: lowest similarity of a match
+        """
+        if not scores:
+            return None
+        best = max(scores.values())
+        if best < threshold:
+            return None
+        tied = [i for i, score in scores.items() if score >= best - TIE_MARGIN]
+        close = [score for score in scores.values() if score > best - self.margin]
+        if len(close) > len(tied):
+            return None
+        if len(tied) == 1:
+            return tied[0]
+        distances = {i: self.distance(i, aired) for i in tied}
+        if None in distances.values():
+            return None
+        closest = sorted(tied, key=lambda i: (distances[i], -scores[i]))
+        if distances[closest[0]] == distances[closest[1]]:
+            return None
+        return closest[0]
+
+    def match(self, titles, threshold, aired=None):
+        """Matches each episode to its most similar video, every video at most
+        once, the most similar pairs first
+        - ``titles``: dict of episode key to episode title
+        - ``threshold``: lowest similarity of a match, between 0 and 1
+        - ``aired``: dict of episode key to the unix time it aired
+        returns:
+            ``matches``: dict of episode key to a (entry, similarity) tuple
+        """
+        aired = aired or {}
+        ranked = []
+        for key, title in titles.items():
+            # videos just below the threshold still count against the margin
+            scores = self.scores(title, max(threshold - self.margin, 0))
+            if scores and max(scores.values()) >= threshold:
+                ranked.append((max(scores.values()), key, scores))
+        ranked.sort(key=lambda item: item[0], reverse=True)
+        matches = {}
+        taken = set()
+        for _, key, scores in ranked:
+            left = {i: score for i, score in scores.items() if i not in taken}
+            i = self.pick(left, aired.get(key), threshold)
+            if i is not None:
+                taken.add(i)
+                matches[key] = (self.entries[i], scores[i])
+        return matches
@@ -0,0 +1,354 @@
+import logging
+import re
+import threading
+import time
+import urllib.parse
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("sonarr_youtubedl")
+
+DURATION_BUCKETS = [
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+    120,
+    300,
+    600,
+    1800,
+    3600,
+]
+THROUGHPUT_BUCKETS = [2**power for power in range(14, 31, 2)]
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values, extra=None):
+    pairs = [
+        '{}="{}"'.format(name, escape(value)) for name, value in zip(names, values)
+    ]
+    if extra is not None:
+        pairs.append('{}="{}"'.format(*extra))
+    if not pairs:
+        return ""
+    return "{" + ",".join(pairs) + "}"
+
+
+class Metric(object):
+    """Base of the metrics, one value per combination of label values"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = list(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labels)
+
+    def render(self):
+        lines = [
+            "# HELP {} {}".format(self.name, self.documentation),
+            "# TYPE {} {}".format(self.name, self.kind),
+        ]
+        with self.lock:
+            values = dict(self.values)
+        for key, value in sorted(values.items()):
+            lines.extend(self.samples(key, value))
+        return lines
+
+    def samples(self, key, value):
+        return ["{}{} {}".format(self.name, format_labels(self.labels, key), value)]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self.key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = list(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            counts, total, count = self.values.get(key, ([0] * len(self.buckets), 0, 0))
+            counts = [
+                c + 1 if value <= bound else c for c, bound in zip(counts, self.buckets)
+            ]
+            self.values[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self, key, value):
+        counts, total, count = value
+        lines = []
+        for bound, bucket_count in zip(self.buckets, counts):
+            lines.append(
+                "{}_bucket{} {}".format(
+                    self.name,
+                    format_labels(self.labels, key, ("le", bound)),
+                    bucket_count,
+                )
+            )
+        lines.append(
+            "{}_bucket{} {}".format(
+                self.name, format_labels(self.labels, key, ("le", "+Inf")), count
+            )
+        )
+        labels = format_labels(self.labels, key)
+        lines.append("{}_sum{} {}".format(self.name, labels, total))
+        lines.append("{}_count{} {}".format(self.name, labels, count))
+        return lines
+
+
+class Registry(object):
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+SCAN_DURATION = REGISTRY.register(
+    Histogram(
+        "sonarr_youtubedl_scan_phase_duration_seconds",
+        "Time spent in each phase of a scan.",
+        ["phase"],
+    )
+)
+LAST_SCAN_DURATION = REGISTRY.register(
+    Gauge(
+        "sonarr_youtubedl_last_scan_duration_seconds",
+        "Duration of the last scan.",
+    )
+)
+LAST_SCAN_TIMESTAMP = REGISTRY.register(
+    Gauge(
+        "sonarr_youtubedl_last_scan_timestamp_seconds",
+        "Unix time the last scan finished.",
+    )
+)
+SCAN_INTERVAL = REGISTRY.register(
+    Gauge(
+        "sonarr_youtubedl_scan_interval_seconds",
+        "Configured time between scans.",
+    )
+)
+SONARR_REQUEST_DURATION = REGISTRY.register(
+    Histogram(
+        "sonarr_youtubedl_sonarr_request_duration_seconds",
+        "Latency of Sonarr api calls.",
+        ["method", "endpoint"],
+    )
+)
+SONARR_REQUEST_FAILURES = REGISTRY.register(
+    Counter(
+        "sonarr_youtubedl_sonarr_request_failures_total",
+        "Sonarr api calls that failed.",
+        ["method", "endpoint"],
+    )
+)
+SEARCH_DURATION = REGISTRY.register(
+    Histogram(
+        "sonarr_youtubedl_search_duration_seconds",
+        "Time spent listing or searching a series url.",
+        ["series"],
+    )
+)
+DOWNLOADS = REGISTRY.register(
+    Counter(
+        "sonarr_youtubedl_downloads_total",
+        "Episode downloads by result.",
+        ["series", "result"],
+    )
+)
+DOWNLOAD_BYTES = REGISTRY.register(
+    Counter(
+        "sonarr_youtubedl_download_bytes_total",
+        "Bytes downloaded.",
+        ["series"],
+    )
+)
+DOWNLOAD_THROUGHPUT = REGISTRY.register(
+    Histogram(
+        "sonarr_youtubedl_download_throughput_bytes_per_second",
+        "Average speed of each finished file download.",
+        ["series"],
+        THROUGHPUT_BUCKETS,
+    )
+)
+QUEUE_DEPTH = REGISTRY.register(
+    Gauge(
+        "sonarr_youtubedl_queue_depth",
+        "Searches and downloads waiting for a worker.",
+    )
+)
+JOBS_RUNNING = REGISTRY.register(
+    Gauge(
+        "sonarr_youtubedl_jobs_running",
+        "Searches and downloads running.",
+    )
+)
+EPISODES = REGISTRY.register(
+    Counter(
+        "sonarr_youtubedl_episodes_total",
+        "Episodes wanted, found, missing and already present over all scans.",
+        ["state"],
+    )
+)
+LAST_SCAN_EPISODES = REGISTRY.register(
+    Gauge(
+        "sonarr_youtubedl_last_scan_episodes",
+        "Episodes wanted, found and missing in the last scan.",
+        ["state"],
+    )
+)
+RATE_LIMIT_WAIT = REGISTRY.register(
+    Counter(
+        "sonarr_youtubedl_rate_limit_wait_seconds_total",
+        "Seconds requests waited for the request budget of their host.",
+        ["host"],
+    )
+)
+THROTTLED = REGISTRY.register(
+    Counter(
+        "sonarr_youtubedl_throttled_total",
+        "Requests a host refused as too many or with a bot check.",
+        ["host"],
+    )
+)
+YTDL_INSTANCES = REGISTRY.register(
+    Counter(
+        "sonarr_youtubedl_ytdl_instances_total",
+        "YoutubeDLs taken from the pool, by whether one was created or reused.",
+        ["result"],
+    )
+)
+
+
+def endpoint_label(url):
+    """Sonarr api path of ``url`` without the api version and with ids collapsed"""
+    path = urllib.parse.urlparse(url).path.split("/api", 1)[-1]
+    path = re.sub(r"^/v\d+", "", path)
+    return re.sub(r"/\d+(?=/|$)", "/{id}", path)
+
+
+@contextmanager
+def sonarr_request(method, url):
+    """Times a Sonarr api call, counting it as failed if it raises"""
+    endpoint = endpoint_label(url)
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        SONARR_REQUEST_FAILURES.inc(method=method, endpoint=endpoint)
+        raise
+    finally:
+        SONARR_REQUEST_DURATION.observe(
+            time.perf_counter() - start, method=method, endpoint=endpoint
+        )
+
+
+def download_hook(series):
+    """Returns a yt-dlp progress hook recording the downloads of ``series``"""
+
+    def hook(d):
+        if d["status"] == "finished":
+            downloaded = d.get("total_bytes") or d.get("downloaded_bytes") or 0
+            DOWNLOAD_BYTES.inc(downloaded, series=series)
+            if d.get("elapsed"):
+                DOWNLOAD_THROUGHPUT.observe(downloaded / d["elapsed"], series=series)
+
+    return hook
+
+
+class MetricsServer(object):
+    """HTTP listener exposing the registry in the Prometheus text format"""
+
+    def __init__(self, host, port, path="/metrics"):
+        self.path = path
+        self.server = ThreadingHTTPServer((host, port), self.handler())
+        self.thread = None
+
+    def handler(self):
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != metrics.path:
+                    self.send_error(404)
+                    return
+                body = REGISTRY.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return MetricsHandler
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, name="metrics", daemon=True
+        )
+        self.thread.start()
+        logger.info(
+            "Serving metrics on port {}{}".format(
+                self.server.server_address[1], self.path
+            )
+        )
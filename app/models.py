@@ -0,0 +1,212 @@
+import os
+from dataclasses import dataclass, field
+
+
+@dataclass(slots=True)
+class SonarrInstance(object):
+    """A Sonarr server of the sonarr section in config.yml, with the state kept
+    per server as series and episode ids are only unique within one"""
+
+    name: str
+    base_url: str
+    api_version: str
+    api_key: str
+    workers: int = 4
+    retries: int = 3
+    rescan_timeout: int = 60
+    client: object = None
+    jobs: object = None
+    not_found: object = None
+    naming_configuration: dict = None
+    naming_fetched: float = 0
+    # series in the library at the last scan
+    series_count: int = 0
+
+    @classmethod
+    def from_config(cls, cfg, name=""):
+        """Builds an instance from its config.yml entry
+        - ``cfg``: sonarr entry from config.yml
+        - ``name``: name of the instance, empty for a single unnamed instance
+        returns:
+            ``instance``: SonarrInstance
+        """
+        api = "api"
+        scheme = "http"
+        basedir = ""
+        if cfg.get("version", "").lower() == "v4":
+            api = "api/v3"
+        if cfg["ssl"].lower() == "true":
+            scheme = "https"
+        if cfg.get("basedir", ""):
+            basedir = "/" + cfg.get("basedir", "")
+        return cls(
+            name,
+            "{0}://{1}:{2}{3}".format(scheme, cfg["host"], str(cfg["port"]), basedir),
+            api,
+            cfg["apikey"],
+            int(cfg.get("workers", 4)),
+            int(cfg.get("retries", 3)),
+            int(cfg.get("rescan_timeout", 60)),
+        )
+
+    def state_file(self, filename):
+        """Returns the name of a state file of this instance, ``filename``
+        itself for an unnamed instance"""
+        if not self.name:
+            return filename
+        base, ext = os.path.splitext(filename)
+        return "{}-{}{}".format(base, self.name, ext)
+
+
+@dataclass(slots=True)
+class SeriesOptions(object):
+    """Options of a series entry in config.yml, parsed once when the config loads"""
+
+    title: str
+    url: str
+    search_mode: str
+    playlistreverse: bool = True
+    playlist_incremental: bool = True
+    offset: dict = None
+    sonarr_regex_match: str = None
+    sonarr_regex_replace: str = None
+    site_regex_match: str = None
+    site_regex_replace: str = None
+    cookies_file: str = None
+    format: str = None
+    subtitles: bool = False
+    subtitles_languages: list = field(default_factory=lambda: ["en"])
+    subtitles_autogenerated: bool = False
+    scan_interval: str = None
+    instance: str = None
+    fuzzy_threshold: float = None
+
+    @classmethod
+    def from_config(cls, wnt, search_mode, fuzzy_threshold=None):
+        """Builds the options of a config.yml series entry
+        - ``wnt``: series entry from config.yml
+        - ``search_mode``: default search mode from the sonarrytdl section
+        - ``fuzzy_threshold``: default fuzzy_threshold from the sonarrytdl section
+        returns:
+            ``options``: SeriesOptions
+        """
+        options = cls(wnt["title"], wnt["url"], search_mode)
+        options.fuzzy_threshold = fuzzy_threshold
+        if "fuzzy_threshold" in wnt:
+            options.fuzzy_threshold = float(wnt["fuzzy_threshold"]) or None
+        if "regex" in wnt:
+            regex = wnt["regex"]
+            if "sonarr" in regex:
+                options.sonarr_regex_match = regex["sonarr"]["match"]
+                options.sonarr_regex_replace = regex["sonarr"]["replace"]
+            if "site" in regex:
+                options.site_regex_match = regex["site"]["match"]
+                options.site_regex_replace = regex["site"]["replace"]
+        if "offset" in wnt:
+            options.offset = wnt["offset"]
+        if "cookies_file" in wnt:
+            options.cookies_file = wnt["cookies_file"]
+        if "format" in wnt:
+            options.format = wnt["format"]
+        if "scan_interval" in wnt:
+            options.scan_interval = wnt["scan_interval"]
+        if "instance" in wnt:
+            options.instance = wnt["instance"]
+        if "search_mode" in wnt:
+            options.search_mode = wnt["search_mode"].lower()
+        # Channels list newest first, playlists usually append at the end
+        options.playlist_incremental = "list=" not in wnt["url"]
+        if "playlist_incremental" in wnt:
+            options.playlist_incremental = wnt["playlist_incremental"] in [
+                "true",
+                "True",
+            ]
+        if "playlistreverse" in wnt:
+            if wnt["playlistreverse"] == "False":
+                options.playlistreverse = False
+        if "subtitles" in wnt:
+            options.subtitles = True
+            if "languages" in wnt["subtitles"]:
+                options.subtitles_languages = wnt["subtitles"]["languages"]
+            if "autogenerated" in wnt["subtitles"]:
+                options.subtitles_autogenerated = wnt["subtitles"]["autogenerated"]
+        return options
+
+
+@dataclass(slots=True)
+class Series(object):
+    """A Sonarr series configured in config.yml"""
+
+    id: int
+    title: str
+    path: str
+    monitored: bool
+    options: SeriesOptions
+    instance: SonarrInstance
+    next_airing: str = None
+    previous_airing: str = None
+
+    @property
+    def key(self):
+        """Identifies the series across Sonarr instances"""
+        return (self.instance.name, self.id)
+
+    @classmethod
+    def from_sonarr(cls, record, options, instance):
+        """Builds a series from a Sonarr series record
+        - ``record``: series from the Sonarr api
+        - ``options``: SeriesOptions of its config.yml entry
+        - ``instance``: SonarrInstance the series belongs to
+        returns:
+            ``series``: Series
+        """
+        return cls(
+            record["id"],
+            record["title"],
+            record["path"],
+            record["monitored"],
+            options,
+            instance,
+            record.get("nextAiring"),
+            record.get("previousAiring"),
+        )
+
+    def to_sonarr(self):
+        """Returns the Sonarr series record the series can be built from again"""
+        return {
+            "id": self.id,
+            "title": self.title,
+            "path": self.path,
+            "monitored": self.monitored,
+            "nextAiring": self.next_airing,
+            "previousAiring": self.previous_airing,
+        }
+
+
+@dataclass(slots=True)
+class WantedEpisode(object):
+    """A monitored, aired episode without a file"""
+
+    id: int
+    series_id: int
+    title: str
+    season_number: int
+    episode_number: int
+    air_date: str = None
+
+    @classmethod
+    def from_sonarr(cls, record, title=None):
+        """Builds an episode from a Sonarr episode record
+        - ``record``: episode from the Sonarr api
+        - ``title``: title to use instead of the Sonarr one
+        returns:
+            ``episode``: WantedEpisode
+        """
+        return cls(
+            record["id"],
+            record["seriesId"],
+            record["title"] if title is None else title,
+            record["seasonNumber"],
+            record["episodeNumber"],
+            record.get("airDateUtc"),
+        )
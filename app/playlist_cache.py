@@ -0,0 +1,117 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("sonarr_youtubedl")
+
+
+class PlaylistCache(object):
+    """On disk index of the videos listed for every series url.
+
+    Entries are stored in listing order (newest first for channels), so an
+    incremental refresh only has to prepend the videos listed before the first
+    already known id. A full refresh replaces the index, which drops removed
+    videos and picks up renamed ones.
+    """
+
+    def __init__(self, cache_file, ttl):
+        """
+        - ``cache_file``: path of the json file holding the cache
+        - ``ttl``: minutes before an index is fully refreshed, 0 to always refresh
+        """
+        self.cache_file = cache_file
+        self.ttl = ttl * 60
+        self.lock = threading.Lock()
+        self.playlists = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, "r") as cachefile:
+                self.playlists = json.load(cachefile)
+            logger.debug("Loaded playlist cache with %s urls", len(self.playlists))
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable playlist cache: {}".format(e))
+            self.playlists = {}
+
+    def save(self):
+        tmp_file = self.cache_file + ".tmp"
+        try:
+            with self.lock, open(tmp_file, "w") as cachefile:
+                json.dump(self.playlists, cachefile)
+            os.replace(tmp_file, self.cache_file)
+        except OSError as e:
+            logger.error("Failed to save playlist cache: {}".format(e))
+
+    def invalidate(self, url=None):
+        """Force a full refresh of ``url``, or of every url if none is given"""
+        for key, playlist in self.playlists.items():
+            if url is None or key == url:
+                playlist["refreshed"] = 0
+
+    def is_stale(self, url):
+        """True if ``url`` was never listed in full or its index outlived the ttl"""
+        playlist = self.playlists.get(url)
+        if playlist is None:
+            return True
+        return time.time() - playlist["refreshed"] >= self.ttl
+
+    def known_ids(self, url):
+        playlist = self.playlists.get(url)
+        if playlist is None:
+            return set()
+        return set(entry["id"] for entry in playlist["entries"])
+
+    def entries(self, url):
+        playlist = self.playlists.get(url)
+        if playlist is None:
+            return None
+        return playlist["entries"]
+
+    def signature(self, url):
+        """Digest of the ids and titles indexed for ``url``, None if never listed"""
+        playlist = self.playlists.get(url)
+        if playlist is None:
+            return None
+        digest = hashlib.sha1()
+        for entry in playlist["entries"]:
+            digest.update("{}\0{}\0".format(entry["id"], entry["title"]).encode())
+        return digest.hexdigest()
+
+    def update(self, url, fetched, full):
+        """Stores freshly listed entries for ``url``
+        - ``fetched``: entries in listing order
+        - ``full``: True if ``fetched`` is the complete listing
+        returns:
+            ``entries``: the updated index
+        """
+        with self.lock:
+            return self._update(url, fetched, full)
+
+    def _update(self, url, fetched, full):
+        seen = time.time()
+        for entry in fetched:
+            entry["last_seen"] = seen
+        playlist = self.playlists.get(url)
+        if full or playlist is None:
+            removed = 0
+            if playlist is not None:
+                removed = len(self.known_ids(url) - set(e["id"] for e in fetched))
+            self.playlists[url] = {"refreshed": seen, "entries": fetched}
+            logger.debug(
+                "Playlist cache refreshed %s with %s entries, %s removed",
+                url,
+                len(fetched),
+                removed,
+            )
+        else:
+            known = self.known_ids(url)
+            new = [entry for entry in fetched if entry["id"] not in known]
+            playlist["entries"] = new + playlist["entries"]
+            logger.debug("Playlist cache added %s new entries to %s", len(new), url)
+        return self.playlists[url]["entries"]
@@ -0,0 +1,220 @@
+import codecs
+import json
+import logging
+import random
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests import exceptions
+from requests.adapters import HTTPAdapter
+from tracing import profiler
+
+logger = logging.getLogger("sonarr_youtubedl")
+
+WHITESPACE = " \t\n\r"
+
+
+def iter_json_array(chunks):
+    """Decodes the items of a JSON array one at a time, as its text streams in.
+    Only one item is held decoded at once, and the text of the items already
+    decoded is dropped.
+    - ``chunks``: iterable of str pieces of the JSON document
+    yields:
+        ``item``: every item of the array
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    started = False
+    for chunk in chunks:
+        buffer += chunk
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in WHITESPACE + ",":
+                if buffer[pos] == "," and not started:
+                    raise ValueError("Expected a JSON array")
+                pos += 1
+            if pos == len(buffer):
+                break
+            if not started:
+                if buffer[pos] != "[":
+                    raise ValueError("Expected a JSON array")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except ValueError:
+                # the item continues in the next chunk
+                break
+            if end == len(buffer) and not isinstance(item, (dict, list, str)):
+                # a number may continue in the next chunk
+                break
+            yield item
+            pos = end
+        buffer = buffer[pos:]
+    raise ValueError("Truncated JSON array")
+
+
+def project(record, fields):
+    """Returns the given fields of a record, the ones it has"""
+    return {field: record[field] for field in fields if field in record}
+
+
+class SonarrClient(object):
+    """Keep-alive HTTP client for the Sonarr API.
+
+    Connections are pooled in a single session, 5xx responses, timeouts and
+    connection errors are retried with jittered exponential backoff, and GET
+    responses carrying an ETag or Last-Modified header are revalidated with a
+    conditional request so unchanged resources come back as a bodyless 304.
+    """
+
+    def __init__(self, api_key, workers=4, retries=3, backoff=1.0, timeout=30):
+        """
+        - ``api_key``: Sonarr api key
+        - ``workers``: connections kept alive, and requests run at once by ``map``
+        - ``retries``: retries of a request failing with a 5xx, timeout or connection
+            error
+        - ``backoff``: seconds, doubled on every retry, randomized for jitter
+        - ``timeout``: seconds before a request times out
+        """
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.chunk_size = 64 * 1024
+        self.session = requests.Session()
+        self.session.params = {"apikey": api_key}
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.lock = threading.Lock()
+        self.validators = {}
+
+    def conditional(self, url, params=None):
+        """Returns the cache key, conditional headers and cached entry of a GET"""
+        logger.debug("Begin GET with url: %s", url)
+        key = url
+        if params is not None:
+            logger.debug("Begin GET with params: %s", params)
+            key = "{}?{}".format(url, urllib.parse.urlencode(sorted(params.items())))
+        headers = {}
+        with self.lock:
+            cached = self.validators.get(key)
+        if cached is not None:
+            etag, last_modified, _ = cached
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        return key, headers, cached
+
+    def remember(self, key, res, value):
+        """Caches ``value`` with the validators of ``res``, if it has any"""
+        etag = res.headers.get("ETag")
+        last_modified = res.headers.get("Last-Modified")
+        if etag or last_modified:
+            with self.lock:
+                self.validators[key] = (etag, last_modified, value)
+
+    def get(self, url, params=None):
+        """GET ``url``, returning the cached response if Sonarr reports it unchanged"""
+        key, headers, cached = self.conditional(url, params)
+        res = self.request("GET", url, params=params, headers=headers)
+        if res.status_code == 304 and cached is not None:
+            logger.debug("Not modified, using cached response for %s", url)
+            return cached[2]
+        self.remember(key, res, res)
+        return res
+
+    def get_records(self, url, params=None, fields=None):
+        """GET the JSON array at ``url``, decoding it as it streams in and keeping
+        only ``fields`` of every record. The projected records are cached, so
+        they are returned without a body when Sonarr reports them unchanged.
+        returns:
+            ``records``: list of dicts, copies of the cached ones
+        """
+        key, headers, cached = self.conditional(url, params)
+        res = self.request("GET", url, params=params, headers=headers, stream=True)
+        try:
+            if res.status_code == 304 and cached is not None:
+                logger.debug("Not modified, using cached records for %s", url)
+                return [dict(record) for record in cached[2]]
+            decoder = codecs.getincrementaldecoder(res.encoding or "utf-8")()
+            chunks = (
+                decoder.decode(chunk) for chunk in res.iter_content(self.chunk_size)
+            )
+            records = [
+                record if fields is None else project(record, fields)
+                for record in iter_json_array(chunks)
+            ]
+        finally:
+            res.close()
+        self.remember(key, res, records)
+        return [dict(record) for record in records]
+
+    def post(self, url, params=None, jsondata=None):
+        logger.debug("Begin POST with url: %s", url)
+        if params is not None:
+            logger.debug("Begin POST with params: %s", params)
+        res = self.request("POST", url, params=params, json=jsondata)
+        logger.debug("POST request successful, status code: %s", res.status_code)
+        return res
+
+    def request(self, method, url, **kwargs):
+        """Sends a request, retrying 5xx responses, timeouts and connection errors"""
+        for attempt in range(self.retries + 1):
+            retry = attempt < self.retries
+            try:
+                res = self.session.request(method, url, timeout=self.timeout, **kwargs)
+                if res.status_code < 500 or not retry:
+                    res.raise_for_status()  # Raise an exception for bad status codes
+                    return res
+                logger.warning(
+                    "Sonarr API returned status code {}, retrying".format(
+                        res.status_code
+                    )
+                )
+                res.close()
+            except exceptions.ConnectionError as e:
+                if not retry:
+                    logger.error(
+                        "Connection error when calling Sonarr API: {}".format(e)
+                    )
+                    raise
+                logger.warning("Connection error calling Sonarr API, retrying")
+            except exceptions.Timeout as e:
+                if not retry:
+                    logger.error("Timeout error when calling Sonarr API: {}".format(e))
+                    raise
+                logger.warning("Timeout calling Sonarr API, retrying")
+            except exceptions.HTTPError as e:
+                logger.error("HTTP error when calling Sonarr API: {}".format(e))
+                logger.error("Response status code: {}".format(res.status_code))
+                logger.error("Response content: {}".format(res.text))
+                raise
+            except exceptions.RequestException as e:
+                logger.error("Request error when calling Sonarr API: {}".format(e))
+                raise
+            time.sleep(random.uniform(0, self.backoff * 2**attempt))
+
+    def map(self, fn, items):
+        """Calls ``fn`` for every item on up to ``workers`` threads
+        returns:
+            ``results``: list of results in the order of ``items``
+        """
+        items = list(items)
+        if len(items) <= 1 or self.workers <= 1:
+            return [fn(item) for item in items]
+
+        def profiled(item):
+            with profiler.profile():
+                return fn(item)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return list(pool.map(profiled, items))
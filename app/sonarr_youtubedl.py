@@ -1,57 +1,219 @@
 import argparse
+import atexit
+import hashlib
 import logging
 import os
 import re
+import socket
 import sys
 import time
 import urllib.parse
+from contextlib import contextmanager
+from dataclasses import asdict
 from datetime import datetime
 
-import requests
+import jobstore
+import metrics
 import schedule
-import yt_dlp
+from cadence import CadenceScheduler, parse_release
+from executor import DownloadExecutor
+from governor import RateGovernor
+from leasequeue import LeaseLost, LeaseQueue
+from ledger import NotFoundLedger
+from library import LibraryIndex
+from matcher import FuzzyMatcher, TitleMatcher
+from metrics import MetricsServer
+from models import Series, SeriesOptions, SonarrInstance, WantedEpisode
+from playlist_cache import PlaylistCache
+from sonarr import SonarrClient, project
+from tracing import profiler, tracer
 from utils import (
+    PostprocessHandOff,
+    ProgressLogger,
     YoutubeDLLogger,
     checkconfig,
     convert_sonarr_to_python_format,
+    iter_entries,
+    log_handlers,
     offsethandler,
     sanitize_str,
     setup_logging,
     upperescape,
     ytdl_hooks,
-    ytdl_hooks_debug,
 )  # NOQA
+from webhook import WebhookServer
+from ytdlpool import YoutubeDLPool
 
-# allow debug arg for verbose logging
-parser = argparse.ArgumentParser(description="Process some integers.")
-parser.add_argument("--debug", action="store_true", help="Enable debug logging")
-args = parser.parse_args()
-
-# setup logger
-logger = setup_logging(True, True, args.debug)
+logger = logging.getLogger("sonarr_youtubedl")
 
 date_format = "%Y-%m-%dT%H:%M:%SZ"
-now = datetime.now()
 
-CONFIGFILE = os.environ["CONFIGPATH"]
-CONFIGPATH = CONFIGFILE.replace("config.yml", "")
+# fields of the Sonarr records kept in memory, everything else is dropped
+SERIES_FIELDS = ["id", "title", "path", "monitored", "nextAiring", "previousAiring"]
+EPISODE_FIELDS = [
+    "id",
+    "seriesId",
+    "title",
+    "seasonNumber",
+    "episodeNumber",
+    "airDateUtc",
+    "monitored",
+    "hasFile",
+]
+# due series are fetched one by one below 1/MISSING_SERIES_SHARE of the library
+MISSING_SERIES_SHARE = 10
+
 SCANINTERVAL = 60
+# seconds a worker keeps the jobs and not found records of series it no
+# longer gets queued, and between the runs dropping them
+WORKER_RETENTION = 30 * 24 * 60 * 60
+WORKER_PRUNE_INTERVAL = 60 * 60
+
+
+def parse_args(argv=None):
+    # allow debug arg for verbose logging
+    parser = argparse.ArgumentParser(description="Process some integers.")
+    parser.add_argument("--debug", action="store_true", help="Enable debug logging")
+    parser.add_argument(
+        "--refresh-cache",
+        action="store_true",
+        help="Fully re-list every series url on the first scan",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="FILE",
+        help="Write timing spans to a Chrome trace file, one event per line if .jsonl",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="FILE",
+        help="Write cProfile statistics of the initial scan to a pstats file",
+    )
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Run a single scan and exit, e.g. from cron; a worker exits once "
+        "the queue is empty",
+    )
+    parser.add_argument(
+        "--role",
+        choices=["standalone", "coordinator", "worker"],
+        default="standalone",
+        help="Scan and download (standalone), only scan and queue the wanted "
+        "series (coordinator), or only download queued series (worker)",
+    )
+    parser.add_argument(
+        "--worker-id",
+        default="{}-{}".format(socket.gethostname(), os.getpid()),
+        help="Id a worker holds its leases with, defaults to host-pid",
+    )
+    return parser.parse_args(argv)
 
 
 class SonarrYTDL(object):
-    def __init__(self):
-        """Set up app with config file settings"""
-        cfg = checkconfig()
+    def __init__(self, config_file=None, refresh_cache=False, role="standalone"):
+        """Set up app with config file settings
+        - ``config_file``: path of config.yml, the CONFIGPATH environment
+            variable if not given
+        - ``refresh_cache``: fully re-list every series url on the first scan
+        - ``role``: standalone, coordinator or worker
+        """
+        self.config_file = config_file or os.environ["CONFIGPATH"]
+        self.config_path = self.config_file.replace("config.yml", "")
+        self.refresh_cache = refresh_cache
+        self.role = role
+        self.config_mtime = None
+        self.config_hash = None
+        self.playlist_cache = None
+        self.instances = {}
+        self.cadence = None
+        self.queue = None
+        self.worker_pruned = 0
+        # Sonarr rescans sent, (instance name, command id) to series title and
+        # the unix time they are given up on
+        self.commands = {}
+        self.governor = None
+        self.library = LibraryIndex()
+        self.ytdl_pool = YoutubeDLPool(self.new_ytdl)
+        self.reload()
 
+    def reload(self):
+        """Reloads config.yml if its content changed since it was last loaded
+        returns:
+            ``bool``: True if the configuration was (re)loaded
+        """
+        config_file = os.path.abspath(self.config_file)
+        if os.path.exists(config_file):
+            mtime = os.path.getmtime(config_file)
+            if mtime == self.config_mtime:
+                return False
+            with open(config_file, "rb") as ymlfile:
+                config_hash = hashlib.sha256(ymlfile.read()).hexdigest()
+            self.config_mtime = mtime
+            if config_hash == self.config_hash:
+                return False
+            self.config_hash = config_hash
+        self.configure(checkconfig(self.config_file))
+        # Sonarr settings may have changed
+        for instance in self.instances.values():
+            instance.naming_fetched = 0
+        return True
+
+    def configure(self, cfg):
+        """Applies the config file settings
+        - ``cfg``: dict containing configuration values
+        """
         # Sonarr_YTDL Setup
 
         try:
             self.set_scan_interval(cfg["sonarrytdl"]["scan_interval"])
+            self.search_mode = cfg["sonarrytdl"].get("search_mode", "playlist")
+            self.search_mode = self.search_mode.lower()
+            if self.search_mode not in ["playlist", "episode"]:
+                sys.exit("Error with sonarrytdl search_mode, use playlist or episode.")
+            self.episode_discovery = (
+                cfg["sonarrytdl"].get("episode_discovery", "missing").lower()
+            )
+            if self.episode_discovery not in ["missing", "series"]:
+                sys.exit("Error with sonarrytdl episode_discovery config.yml value.")
+            self.missing_page_size = int(
+                cfg["sonarrytdl"].get("missing_page_size", 1000)
+            )
+            playlist_cache_ttl = int(cfg["sonarrytdl"].get("playlist_cache_ttl", 1440))
+            if self.playlist_cache is None:
+                self.playlist_cache = PlaylistCache(
+                    self.config_path + "playlist_cache.json", playlist_cache_ttl
+                )
+            else:
+                self.playlist_cache.ttl = playlist_cache_ttl * 60
+            self.not_found_max_backoff = int(
+                cfg["sonarrytdl"].get("not_found_max_backoff", 1440)
+            )
+            self.naming_cache_ttl = int(cfg["sonarrytdl"].get("naming_cache_ttl", 60))
+            self.import_grace = int(cfg["sonarrytdl"].get("import_grace", 60))
+            self.progress_interval = int(cfg["sonarrytdl"].get("progress_interval", 10))
+            # 0, the default, leaves fuzzy matching off
+            self.fuzzy_threshold = (
+                float(cfg["sonarrytdl"].get("fuzzy_threshold", 0)) or None
+            )
+            adaptive_scan = cfg["sonarrytdl"].get("adaptive_scan", "true") in [
+                "true",
+                "True",
+            ]
+            max_scan_interval = int(cfg["sonarrytdl"].get("max_scan_interval", 1440))
+            if self.cadence is None:
+                self.cadence = CadenceScheduler(max_scan_interval, adaptive_scan)
+            else:
+                self.cadence.max_interval = max_scan_interval * 60
+                self.cadence.adaptive = adaptive_scan
+            if self.refresh_cache:
+                self.refresh_cache = False
+                self.playlist_cache.invalidate()
             try:
                 self.debug = cfg["sonarrytdl"]["debug"] in ["true", "True"]
                 if self.debug:
                     logger.setLevel(logging.DEBUG)
-                    for logs in logger.handlers:
+                    for logs in log_handlers(logger):
                         if logs.name == "FileHandler":
                             logs.setLevel(logging.DEBUG)
                         if logs.name == "StreamHandler":
@@ -64,81 +226,281 @@ class SonarrYTDL(object):
 
         # Sonarr Setup
         try:
-            api = "api"
-            scheme = "http"
-            basedir = ""
-            if cfg["sonarr"].get("version", "").lower() == "v4":
-                api = "api/v3"
-                logger.debug("Sonarr api set to v4")
-            if cfg["sonarr"]["ssl"].lower() == "true":
-                scheme = "https"
-            if cfg["sonarr"].get("basedir", ""):
-                basedir = "/" + cfg["sonarr"].get("basedir", "")
-
-            self.base_url = "{0}://{1}:{2}{3}".format(
-                scheme, cfg["sonarr"]["host"], str(cfg["sonarr"]["port"]), basedir
-            )
-            self.sonarr_api_version = api
-            self.api_key = cfg["sonarr"]["apikey"]
+            # a single instance, or a list of named instances
+            if isinstance(cfg["sonarr"], dict):
+                instances = [SonarrInstance.from_config(cfg["sonarr"])]
+            else:
+                instances = [
+                    SonarrInstance.from_config(sonarr, sonarr["name"])
+                    for sonarr in cfg["sonarr"]
+                ]
+            if len(set(instance.name for instance in instances)) != len(instances):
+                sys.exit("Error with sonarr config.yml values, names must be unique.")
         except Exception:
             sys.exit("Error with sonarr config.yml values.")
+        self.configure_instances(instances)
 
         # YTDL Setup
         try:
             self.ytdl_format = cfg["ytdl"]["default_format"]
+            self.download_workers = int(cfg["ytdl"].get("workers", 1))
+            self.series_workers = int(cfg["ytdl"].get("series_workers", 1))
+            self.host_workers = int(cfg["ytdl"].get("host_workers", 2))
+            self.max_attempts = int(cfg["ytdl"].get("max_attempts", 3))
+            self.postprocess_workers = int(
+                cfg["ytdl"].get("postprocess_workers", os.cpu_count() or 1)
+            )
         except Exception:
             sys.exit("Error with ytdl config.yml values.")
 
-        # Naming Configuration from Sonarr
-        naming_configuration = self.get_naming_configuration()
+        # Webhook Setup
+        try:
+            webhook = cfg.get("webhook")
+            self.webhook_enabled = webhook is not None
+            if self.webhook_enabled:
+                self.webhook_host = webhook.get("host", "0.0.0.0")
+                self.webhook_port = int(webhook.get("port", 8990))
+                self.webhook_path = webhook.get("path", "/webhook")
+                self.webhook_username = webhook.get("username")
+                self.webhook_password = webhook.get("password")
+                self.full_scan_interval = int(webhook.get("full_scan_interval", 60))
+        except Exception:
+            sys.exit("Error with webhook config.yml values.")
 
-        if naming_configuration is not None:
-            self.naming_configuration = naming_configuration
-        else:
-            self.naming_configuration = None
+        # Metrics Setup
+        try:
+            metrics_cfg = cfg.get("metrics")
+            self.metrics_enabled = metrics_cfg is not None
+            if self.metrics_enabled:
+                self.metrics_host = metrics_cfg.get("host", "0.0.0.0")
+                self.metrics_port = int(metrics_cfg.get("port", 9095))
+                self.metrics_path = metrics_cfg.get("path", "/metrics")
+        except Exception:
+            sys.exit("Error with metrics config.yml values.")
+
+        # Queue Setup
+        try:
+            queue_cfg = cfg.get("queue") or {}
+            self.queue_lease = int(queue_cfg.get("lease", 300))
+            self.queue_poll = int(queue_cfg.get("poll", 30))
+            self.queue_file = os.path.join(
+                self.config_path, queue_cfg.get("file", "queue.db")
+            )
+        except Exception:
+            sys.exit("Error with queue config.yml values.")
+
+        # Rate Limit Setup
+        try:
+            ratelimit_cfg = cfg.get("ratelimit") or {}
+
+            def requests_per_minute(section, default):
+                rate = float(section.get("requests_per_minute", default))
+                if rate <= 0:
+                    sys.exit(
+                        "Error with ratelimit requests_per_minute, use more than 0."
+                    )
+                return rate
+
+            rate = requests_per_minute(ratelimit_cfg, 30)
+            burst = float(ratelimit_cfg.get("burst", 5))
+
+            def budget(section):
+                return (
+                    requests_per_minute(section, rate),
+                    float(section.get("burst", burst)),
+                )
+
+            hosts = {
+                host.removeprefix("www."): budget(section)
+                for host, section in (ratelimit_cfg.get("hosts") or {}).items()
+            }
+            # keyed like appendcookie sets the cookiefile option
+            cookies = {
+                os.path.abspath(self.config_path + cookie_file): budget(section)
+                for cookie_file, section in (ratelimit_cfg.get("cookies") or {}).items()
+            }
+            if self.governor is None:
+                self.governor = RateGovernor(rate, burst, hosts, cookies)
+            else:
+                self.governor.set_budgets(rate, burst, hosts, cookies)
+            self.governor.backoff = float(ratelimit_cfg.get("backoff", 0.5))
+            self.governor.recovery = float(ratelimit_cfg.get("recovery", 0.05))
+            self.governor.cooldown = int(ratelimit_cfg.get("cooldown", 60))
+        except Exception:
+            sys.exit("Error with ratelimit config.yml values.")
 
         # YTDL Setup
         try:
             self.series = cfg["series"]
+            # keyed by title and instance name, None matching every instance
+            self.series_options = {}
+            for wnt in self.series:
+                options = SeriesOptions.from_config(
+                    wnt, self.search_mode, self.fuzzy_threshold
+                )
+                if not 0 < (options.fuzzy_threshold or 1) <= 1:
+                    sys.exit("Error with series fuzzy_threshold, use 0 to 1.")
+                self.series_options[(options.title, options.instance)] = options
         except Exception:
             sys.exit("Error with series config.yml values.")
 
-    def get_naming_configuration(self):
-        """Returns the naming configuration for the given series"""
+    def configure_instances(self, instances):
+        """Sets up the Sonarr instances, keeping the state of the known ones
+        - ``instances``: list of SonarrInstance from config.yml
+        """
+        configured = {}
+        for instance in instances:
+            known = self.instances.get(instance.name)
+            if known is not None:
+                instance.jobs = known.jobs
+                instance.not_found = known.not_found
+                instance.naming_configuration = known.naming_configuration
+            if instance.jobs is None:
+                instance.jobs = jobstore.JobStore(
+                    self.config_path + instance.state_file("jobs.db")
+                )
+            if instance.not_found is None:
+                instance.not_found = NotFoundLedger(
+                    self.config_path + instance.state_file("not_found.json"),
+                    int(SCANINTERVAL),
+                    self.not_found_max_backoff,
+                )
+            else:
+                instance.not_found.backoff = int(SCANINTERVAL) * 60
+                instance.not_found.max_backoff = self.not_found_max_backoff * 60
+            instance.client = SonarrClient(
+                instance.api_key, instance.workers, instance.retries
+            )
+            configured[instance.name] = instance
+            logger.debug(
+                "Sonarr %sat %s using %s",
+                instance.name + " " if instance.name else "",
+                instance.base_url,
+                instance.api_version,
+            )
+        for name, instance in self.instances.items():
+            if name not in configured:
+                instance.jobs.close()
+        self.instances = configured
+
+    def refresh_naming_configuration(self):
+        """Fetches the naming configuration of every Sonarr instance once
+        naming_cache_ttl passed"""
+        for instance in self.instances.values():
+            if (
+                instance.naming_configuration is not None
+                and time.time() - instance.naming_fetched < self.naming_cache_ttl * 60
+            ):
+                continue
+            naming_configuration = self.get_naming_configuration(instance)
+            if naming_configuration is not None:
+                instance.naming_configuration = naming_configuration
+                instance.naming_fetched = time.time()
+
+    def get_naming_configuration(self, instance):
+        """Returns the naming configuration of the given Sonarr instance"""
         logger.debug("Begin call Sonarr for naming configuration")
         try:
             res = self.request_get(
-                "{}/{}/config/naming".format(self.base_url, self.sonarr_api_version)
+                instance,
+                "{}/{}/config/naming".format(instance.base_url, instance.api_version),
             )
             return res.json()
         except Exception as e:
             logger.error("Failed to get naming configuration: {}".format(e))
             return None
 
-    def get_episodes_by_series_id(self, series_id):
+    def get_episodes_by_series_id(self, instance, series_id):
         """Returns all episodes for the given series"""
-        logger.debug(
-            "Begin call Sonarr for all episodes for series_id: {}".format(series_id)
-        )
+        logger.debug("Begin call Sonarr for all episodes for series_id: %s", series_id)
         args = {"seriesId": series_id}
         try:
-            res = self.request_get(
-                "{}/{}/episode".format(self.base_url, self.sonarr_api_version), args
+            return self.request_records(
+                instance,
+                "{}/{}/episode".format(instance.base_url, instance.api_version),
+                args,
+                EPISODE_FIELDS,
             )
-            return res.json()
         except Exception as e:
             logger.error(
                 "Failed to get episodes for series_id {}: {}".format(series_id, e)
             )
             return []
 
-    def get_episode_files_by_series_id(self, series_id):
+    def get_episodes_by_series_ids(self, instance, series_ids):
+        """Returns a dict of series id to all its episodes, fetched in parallel"""
+        series_ids = list(series_ids)
+        return dict(
+            zip(
+                series_ids,
+                instance.client.map(
+                    lambda series_id: self.get_episodes_by_series_id(
+                        instance, series_id
+                    ),
+                    series_ids,
+                ),
+            )
+        )
+
+    def get_wanted_missing(self, instance):
+        """Returns every monitored missing episode, paging through wanted/missing
+        returns:
+            ``records``: list of episodes, None if Sonarr could not be queried
+        """
+        logger.debug("Begin call Sonarr for wanted missing episodes")
+        records = []
+        page = 1
+        while True:
+            args = {"page": page, "pageSize": self.missing_page_size}
+            if instance.api_version == "api":
+                args.update({"filterKey": "monitored", "filterValue": "true"})
+            else:
+                args.update({"monitored": "true"})
+            try:
+                res = self.request_get(
+                    instance,
+                    "{}/{}/wanted/missing".format(
+                        instance.base_url, instance.api_version
+                    ),
+                    args,
+                )
+                data = res.json()
+            except Exception as e:
+                logger.error("Failed to get wanted missing episodes: {}".format(e))
+                return None
+            records.extend(
+                project(eps, EPISODE_FIELDS) for eps in data.get("records", [])
+            )
+            if not data.get("records") or page * self.missing_page_size >= data.get(
+                "totalRecords", 0
+            ):
+                return records
+            page += 1
+
+    def get_missing_episodes_by_series_ids(self, instance, series_ids):
+        """Returns a dict of series id to its monitored missing episodes
+        returns:
+            ``series_episodes``: dict, None if Sonarr could not be queried
+        """
+        series_episodes = {series_id: [] for series_id in series_ids}
+        if not series_episodes:
+            return series_episodes
+        records = self.get_wanted_missing(instance)
+        if records is None:
+            return None
+        for eps in records:
+            if eps["seriesId"] in series_episodes:
+                series_episodes[eps["seriesId"]].append(eps)
+        return series_episodes
+
+    def get_episode_files_by_series_id(self, instance, series_id):
         """Returns all episode files for the given series"""
+        args = {"seriesId": series_id}
         try:
             res = self.request_get(
-                "{}/{}/episodefile?seriesId={}".format(
-                    self.base_url, self.sonarr_api_version, series_id
-                )
+                instance,
+                "{}/{}/episodefile".format(instance.base_url, instance.api_version),
+                args,
             )
             return res.json()
         except Exception as e:
@@ -147,28 +509,29 @@ class SonarrYTDL(object):
             )
             return []
 
-    def get_series(self):
-        """Return all series in your collection"""
+    def get_series(self, instance):
+        """Return all series in the collection of a Sonarr instance"""
         logger.debug("Begin call Sonarr for all available series")
         try:
-            res = self.request_get(
-                "{}/{}/series".format(self.base_url, self.sonarr_api_version)
+            return self.request_records(
+                instance,
+                "{}/{}/series".format(instance.base_url, instance.api_version),
+                None,
+                SERIES_FIELDS,
             )
-            return res.json()
         except Exception as e:
             logger.error("Failed to get series from Sonarr: {}".format(e))
             return []
 
-    def get_series_by_series_id(self, series_id):
+    def get_series_by_series_id(self, instance, series_id):
         """Return the series with the matching ID or 404 if no matching series is found"""
-        logger.debug(
-            "Begin call Sonarr for specific series series_id: {}".format(series_id)
-        )
+        logger.debug("Begin call Sonarr for specific series series_id: %s", series_id)
         try:
             res = self.request_get(
+                instance,
                 "{}/{}/series/{}".format(
-                    self.base_url, self.sonarr_api_version, series_id
-                )
+                    instance.base_url, instance.api_version, series_id
+                ),
             )
             return res.json()
         except Exception as e:
@@ -177,78 +540,42 @@ class SonarrYTDL(object):
             )
             return None
 
-    def request_get(self, url, params=None):
-        """Wrapper on the requests.get"""
-        logger.debug("Begin GET with url: {}".format(url))
-        args = {"apikey": self.api_key}
-        if params is not None:
-            logger.debug("Begin GET with params: {}".format(params))
-            args.update(params)
-        url = "{}?{}".format(url, urllib.parse.urlencode(args))
-        try:
-            res = requests.get(url, timeout=30)
-            res.raise_for_status()  # Raise an exception for bad status codes
-            return res
-        except requests.exceptions.ConnectionError as e:
-            logger.error("Connection error when calling Sonarr API: {}".format(e))
-            raise
-        except requests.exceptions.Timeout as e:
-            logger.error("Timeout error when calling Sonarr API: {}".format(e))
-            raise
-        except requests.exceptions.HTTPError as e:
-            logger.error("HTTP error when calling Sonarr API: {}".format(e))
-            logger.error("Response status code: {}".format(res.status_code))
-            logger.error("Response content: {}".format(res.text))
-            raise
-        except requests.exceptions.RequestException as e:
-            logger.error("Request error when calling Sonarr API: {}".format(e))
-            raise
+    def request_get(self, instance, url, params=None):
+        """Wrapper on the Sonarr client GET"""
+        with (
+            metrics.sonarr_request("GET", url),
+            tracer.span("GET " + metrics.endpoint_label(url), "sonarr", params=params),
+        ):
+            return instance.client.get(url, params)
 
-    def request_put(self, url, params=None, jsondata=None):
-        """Wrapper on the requests.post"""
-        logger.debug("Begin POST with url: {}".format(url))
-        headers = {
-            "Content-Type": "application/json",
-        }
-        args = {"apikey": self.api_key}
-        if params is not None:
-            logger.debug("Begin POST with params: {}".format(params))
-            args.update(params)
+    def request_records(self, instance, url, params=None, fields=None):
+        """Wrapper on the Sonarr client streaming GET of a list of records"""
+        with (
+            metrics.sonarr_request("GET", url),
+            tracer.span("GET " + metrics.endpoint_label(url), "sonarr", params=params),
+        ):
+            return instance.client.get_records(url, params, fields)
 
-        try:
-            res = requests.post(
-                url, headers=headers, params=args, json=jsondata, timeout=30
-            )
-            res.raise_for_status()  # Raise an exception for bad status codes
-            logger.debug(
-                "POST request successful, status code: {}".format(res.status_code)
-            )
-            return res
-        except requests.exceptions.ConnectionError as e:
-            logger.error("Connection error when calling Sonarr API: {}".format(e))
-            raise
-        except requests.exceptions.Timeout as e:
-            logger.error("Timeout error when calling Sonarr API: {}".format(e))
-            raise
-        except requests.exceptions.HTTPError as e:
-            logger.error("HTTP error when calling Sonarr API: {}".format(e))
-            logger.error("Response status code: {}".format(res.status_code))
-            logger.error("Response content: {}".format(res.text))
-            raise
-        except requests.exceptions.RequestException as e:
-            logger.error("Request error when calling Sonarr API: {}".format(e))
-            raise
+    def request_put(self, instance, url, params=None, jsondata=None):
+        """Wrapper on the Sonarr client POST"""
+        with (
+            metrics.sonarr_request("POST", url),
+            tracer.span("POST " + metrics.endpoint_label(url), "sonarr", data=jsondata),
+        ):
+            return instance.client.post(url, params, jsondata)
 
-    def rescanseries(self, series_id):
+    def rescanseries(self, instance, series_id):
         """Refresh series information from trakt and rescan disk"""
-        logger.debug("Begin call Sonarr to rescan for series_id: {}".format(series_id))
+        logger.debug("Begin call Sonarr to rescan for series_id: %s", series_id)
         data = {"name": "RescanSeries", "seriesId": int(series_id)}
         try:
-            res = self.request_put(
-                "{}/{}/command".format(self.base_url, self.sonarr_api_version),
-                None,
-                data,
-            )
+            with tracer.span("rescanseries", "sonarr", series_id=series_id):
+                res = self.request_put(
+                    instance,
+                    "{}/{}/command".format(instance.base_url, instance.api_version),
+                    None,
+                    data,
+                )
             return res.json()
         except Exception as e:
             logger.error(
@@ -256,87 +583,346 @@ class SonarrYTDL(object):
             )
             return None
 
-    def filterseries(self):
-        """Return all series in Sonarr that are to be downloaded by youtube-dl"""
-        series = self.get_series()
+    def get_command(self, instance, command_id):
+        """Returns the Sonarr command with the given id"""
+        try:
+            res = self.request_get(
+                instance,
+                "{}/{}/command/{}".format(
+                    instance.base_url, instance.api_version, command_id
+                ),
+            )
+            return res.json()
+        except Exception as e:
+            logger.error("Failed to get command {}: {}".format(command_id, e))
+            return None
+
+    def check_commands(self):
+        """Logs the Sonarr rescans that finished since they were sent, without
+        waiting for the others, which are checked again on the next scan. A
+        rescan still running after the rescan_timeout of its instance is given
+        up on.
+        returns:
+            ``bool``: True if rescans are still running
+        """
+        now = time.time()
+        with tracer.span("check_commands", "sonarr", commands=len(self.commands)):
+            for key, (title, deadline) in list(self.commands.items()):
+                instance = self.instances.get(key[0])
+                command = None
+                if instance is not None:
+                    command = self.get_command(instance, key[1])
+                if command is None:
+                    del self.commands[key]
+                    continue
+                status = command.get("status", command.get("state", ""))
+                if status in ["completed", "failed", "aborted", "cancelled"]:
+                    logger.info("  Sonarr rescan of {} {}".format(title, status))
+                    del self.commands[key]
+                elif now >= deadline:
+                    logger.warning("  Sonarr is still rescanning {}".format(title))
+                    del self.commands[key]
+        return bool(self.commands)
+
+    def wait_for_commands(self):
+        """Polls Sonarr until the rescans sent are finished or timed out, for a
+        single scan that has no next scan to check them on"""
+        while self.check_commands():
+            time.sleep(2)
+
+    def filterseries(self, series_keys=None):
+        """Return all series in Sonarr that are to be downloaded by youtube-dl
+        - ``series_keys``: only return the series with these (Sonarr instance
+            name, series id) keys if given, an instance name of None matching
+            the series id on every instance
+        returns:
+            ``series``: list of Series
+        """
         matched = []
-        for ser in series[:]:
-            for wnt in self.series:
-                if wnt["title"] == ser["title"]:
-                    # Set default values
-                    ser["subtitles"] = False
-                    ser["playlistreverse"] = True
-                    ser["subtitles_languages"] = ["en"]
-                    ser["subtitles_autogenerated"] = False
-                    # Update values
-                    if "regex" in wnt:
-                        regex = wnt["regex"]
-                        if "sonarr" in regex:
-                            ser["sonarr_regex_match"] = regex["sonarr"]["match"]
-                            ser["sonarr_regex_replace"] = regex["sonarr"]["replace"]
-                        if "site" in regex:
-                            ser["site_regex_match"] = regex["site"]["match"]
-                            ser["site_regex_replace"] = regex["site"]["replace"]
-                    if "offset" in wnt:
-                        ser["offset"] = wnt["offset"]
-                    if "cookies_file" in wnt:
-                        ser["cookies_file"] = wnt["cookies_file"]
-                    if "format" in wnt:
-                        ser["format"] = wnt["format"]
-                    if "playlistreverse" in wnt:
-                        if wnt["playlistreverse"] == "False":
-                            ser["playlistreverse"] = False
-                    if "subtitles" in wnt:
-                        ser["subtitles"] = True
-                        if "languages" in wnt["subtitles"]:
-                            ser["subtitles_languages"] = wnt["subtitles"]["languages"]
-                        if "autogenerated" in wnt["subtitles"]:
-                            ser["subtitles_autogenerated"] = wnt["subtitles"][
-                                "autogenerated"
-                            ]
-                    ser["url"] = wnt["url"]
-                    matched.append(ser)
+        for instance in self.instances.values():
+            records = self.get_series(instance)
+            instance.series_count = len(records)
+            for record in records:
+                if series_keys is not None and not (
+                    (instance.name, record["id"]) in series_keys
+                    or (None, record["id"]) in series_keys
+                ):
+                    continue
+                options = self.get_series_options(record["title"], instance)
+                if options is not None:
+                    matched.append(Series.from_sonarr(record, options, instance))
         for check in matched:
-            if not check["monitored"]:
-                logger.warn("{0} is not currently monitored".format(ser["title"]))
-        del series[:]
+            if not check.monitored:
+                logger.warn("{0} is not currently monitored".format(check.title))
         return matched
 
+    def get_series_options(self, title, instance):
+        """Returns the SeriesOptions of a series of a Sonarr instance, None if
+        the series is not configured"""
+        options = self.series_options.get((title, instance.name))
+        if options is None:
+            options = self.series_options.get((title, None))
+        return options
+
+    def get_series_episodes(self, instance, series, now):
+        """Returns a dict of series id to the episodes of the given series of
+        one Sonarr instance, from wanted/missing where that covers the series"""
+        series_episodes = {}
+        if self.episode_discovery == "missing":
+            # wanted/missing only lists aired episodes of monitored series, a
+            # negative offset or an unmonitored series needs every episode
+            missing_ids = [
+                ser.id
+                for ser in series
+                if ser.monitored
+                and (
+                    ser.options.offset is None
+                    or offsethandler(now, ser.options.offset) >= now
+                )
+            ]
+            # paging through the missing episodes of the whole library costs
+            # more than fetching the episodes of a tenth of it
+            if len(missing_ids) * MISSING_SERIES_SHARE < instance.series_count:
+                missing_ids = []
+            series_episodes = self.get_missing_episodes_by_series_ids(
+                instance, missing_ids
+            )
+            if series_episodes is None:
+                logger.warning("Falling back to fetching all episodes per series")
+                series_episodes = {}
+        series_episodes.update(
+            self.get_episodes_by_series_ids(
+                instance, (ser.id for ser in series if ser.id not in series_episodes)
+            )
+        )
+        return series_episodes
+
     def getseriesepisodes(self, series):
-        needed = []
-        for ser in series[:]:
-            episodes = self.get_episodes_by_series_id(ser["id"])
-            for eps in episodes[:]:
+        """Returns the wanted episodes of the given series, dropping the series
+        without any from the list
+        - ``series``: list of Series
+        returns:
+            ``needed``: dict of series key to its list of WantedEpisode
+        """
+        now = datetime.now()
+        needed = {}
+        series_episodes = {}
+        for instance in self.instances.values():
+            instance_series = [ser for ser in series if ser.instance is instance]
+            if instance_series:
+                series_episodes[instance.name] = self.get_series_episodes(
+                    instance, instance_series, now
+                )
+        for ser in series:
+            options = ser.options
+            episodes = []
+            for eps in series_episodes[ser.instance.name].pop(ser.id):
                 eps_date = now
                 if "airDateUtc" in eps:
                     eps_date = datetime.strptime(eps["airDateUtc"], date_format)
-                    if "offset" in ser:
-                        eps_date = offsethandler(eps_date, ser["offset"])
-                if not eps["monitored"]:
-                    episodes.remove(eps)
-                elif eps["hasFile"]:
-                    episodes.remove(eps)
-                elif eps_date > now:
-                    episodes.remove(eps)
-                else:
-                    if "sonarr_regex_match" in ser:
-                        match = ser["sonarr_regex_match"]
-                        replace = ser["sonarr_regex_replace"]
-                        eps["title"] = re.sub(match, replace, eps["title"])
-                    needed.append(eps)
+                    if options.offset is not None:
+                        eps_date = offsethandler(eps_date, options.offset)
+                if not eps["monitored"] or eps["hasFile"] or eps_date > now:
                     continue
+                title = None
+                if options.sonarr_regex_match is not None:
+                    match = options.sonarr_regex_match
+                    replace = options.sonarr_regex_replace
+                    title = re.sub(match, replace, eps["title"])
+                episodes.append(WantedEpisode.from_sonarr(eps, title))
+            ser.instance.not_found.prune(ser.id, [eps.id for eps in episodes])
+            ser.instance.jobs.prune(ser.id, [eps.id for eps in episodes])
+            needed[ser.key] = episodes
+        self.skip_present(series, needed)
+        kept = []
+        for ser in series:
+            episodes = needed.pop(ser.key)
             if len(episodes) == 0:
-                logger.info("{0} no episodes needed".format(ser["title"]))
-                series.remove(ser)
+                logger.info("{0} no episodes needed".format(ser.title))
             else:
-                logger.info(
-                    "{0} missing {1} episodes".format(ser["title"], len(episodes))
-                )
+                kept.append(ser)
+                needed[ser.key] = episodes
+                logger.info("{0} missing {1} episodes".format(ser.title, len(episodes)))
                 for i, e in enumerate(episodes):
+                    logger.info("  {0}: {1} - {2}".format(i + 1, ser.title, e.title))
+        series[:] = kept
+        return needed
+
+    def skip_present(self, series, wanted):
+        """Drops the wanted episodes downloaded less than import_grace minutes
+        ago whose file is still in the library, waiting for Sonarr to import
+        it. Once the grace passed, Sonarr rejected or never imported the file,
+        it is removed and the episode downloaded again.
+        - ``series``: list of Series
+        - ``wanted``: dict of series key to its list of WantedEpisode Sonarr
+            lists without a file, updated in place
+        """
+        present = 0
+        now = time.time()
+        for ser in series:
+            episodes = []
+            for eps in wanted[ser.key]:
+                job = ser.instance.jobs.get(ser.id, eps.id)
+                if job is None or job["state"] != jobstore.DOWNLOADED:
+                    episodes.append(eps)
+                    continue
+                try:
+                    found = self.library.find(self.get_episode_filename(ser, eps))
+                except Exception as e:
+                    logger.error(
+                        "Failed to look up {} in the library: {}".format(eps.title, e)
+                    )
+                    found = None
+                if found is None:
+                    episodes.append(eps)
+                elif now - job["updated"] >= self.import_grace * 60:
+                    logger.warning(
+                        "Sonarr did not import {} in {} minutes, downloading {} {}"
+                        " again".format(found, self.import_grace, ser.title, eps.title)
+                    )
+                    try:
+                        os.remove(found)
+                    except OSError as e:
+                        logger.error("Failed to remove {}: {}".format(found, e))
+                    episodes.append(eps)
+                else:
                     logger.info(
-                        "  {0}: {1} - {2}".format(i + 1, ser["title"], e["title"])
+                        "{} {} is downloaded, waiting for Sonarr to import {}".format(
+                            ser.title, eps.title, found
+                        )
                     )
-        return needed
+                    present += 1
+            wanted[ser.key] = episodes
+        if present:
+            metrics.EPISODES.inc(present, state="present")
+
+    def scan_interval(self):
+        """Returns the minutes between scans of a series expecting a release"""
+        if self.webhook_enabled:
+            return self.full_scan_interval
+        return int(SCANINTERVAL)
+
+    def plan_scans(self, series):
+        """Schedules the next scan of every scanned series from its release cadence"""
+        for ser in series:
+            waiting = [
+                due
+                for due in [
+                    ser.instance.not_found.next_search(ser.id),
+                    ser.instance.jobs.next_retry(ser.id),
+                ]
+                if due is not None
+            ]
+            self.cadence.plan(
+                ser,
+                self.scan_interval(),
+                self.playlist_cache.entries(ser.options.url),
+                min(waiting) if waiting else None,
+            )
+
+    def lease_queue(self):
+        """Returns the queue shared by the coordinator and workers, opened on
+        first use"""
+        if self.queue is not None and self.queue.db_file != self.queue_file:
+            self.queue.close()
+            self.queue = None
+        if self.queue is None:
+            self.queue = LeaseQueue(self.queue_file, self.queue_lease)
+        self.queue.lease_seconds = self.queue_lease
+        return self.queue
+
+    def enqueue(self, scanned, episodes):
+        """Hands the series with wanted episodes to the workers
+        - ``scanned``: list of Series that were scanned
+        - ``episodes``: dict of series key to its list of WantedEpisode
+        """
+        queue = self.lease_queue()
+        for ser in scanned:
+            if ser.key not in episodes:
+                queue.discard(ser.instance.name, ser.id)
+                continue
+            queue.put(
+                ser.instance.name,
+                ser.id,
+                ser.title,
+                {
+                    "series": ser.to_sonarr(),
+                    "episodes": [asdict(eps) for eps in episodes[ser.key]],
+                },
+            )
+        counts = queue.counts()
+        logger.info(
+            "{} series queued for the workers, {} being worked on".format(
+                counts["queued"], counts["leased"]
+            )
+        )
+
+    def work(self, worker_id):
+        """Leases the next series queued by the coordinator and downloads its
+        wanted episodes, renewing the lease until done
+        - ``worker_id``: id the lease is held with
+        returns:
+            ``bool``: False if the queue was empty
+        """
+        queue = self.lease_queue()
+        task = queue.lease(worker_id)
+        if task is None:
+            self.expire_worker_state()
+            return False
+        record = task["payload"]["series"]
+        instance = self.instances.get(task["instance"])
+        options = None
+        if instance is not None:
+            options = self.get_series_options(record["title"], instance)
+        if options is None:
+            logger.error(
+                "Dropping queued {}, it is not configured here".format(task["title"])
+            )
+            queue.complete(task)
+            return True
+        ser = Series.from_sonarr(record, options, instance)
+        episodes = {
+            ser.key: [WantedEpisode(**eps) for eps in task["payload"]["episodes"]]
+        }
+        logger.info(
+            "Leased {} with {} missing episodes".format(
+                ser.title, len(episodes[ser.key])
+            )
+        )
+        episode_ids = [eps.id for eps in episodes[ser.key]]
+        instance.not_found.prune(ser.id, episode_ids)
+        instance.jobs.prune(ser.id, episode_ids)
+        try:
+            self.refresh_naming_configuration()
+            # the downloads are recorded in the jobs of this worker
+            self.skip_present([ser], episodes)
+            if not episodes[ser.key]:
+                logger.info("{} no episodes needed".format(ser.title))
+                queue.complete(task)
+                return True
+            with queue.holding(task) as lost:
+                self.download([ser], episodes, lost)
+        except Exception:
+            queue.release(task)
+            raise
+        if lost.is_set():
+            logger.warning("Stopped working on {}".format(ser.title))
+            return True
+        queue.complete(task)
+        return True
+
+    def expire_worker_state(self):
+        """Drops the jobs and not found records a worker kept of series it was
+        not queued for in WORKER_RETENTION, as the coordinator never tells a
+        worker that a series is no longer wanted"""
+        now = time.time()
+        if now - self.worker_pruned < WORKER_PRUNE_INTERVAL:
+            return
+        self.worker_pruned = now
+        for instance in self.instances.values():
+            instance.jobs.expire(now - WORKER_RETENTION)
+            instance.not_found.expire(now - WORKER_RETENTION)
+            instance.not_found.save()
 
     def appendcookie(self, ytdlopts, cookies=None):
         """Checks if specified cookie file exists in config
@@ -348,12 +934,12 @@ class SonarrYTDL(object):
                 updated with cookies value if cookies file exists
         """
         if cookies is not None:
-            cookie_path = os.path.abspath(CONFIGPATH + cookies)
+            cookie_path = os.path.abspath(self.config_path + cookies)
             cookie_exists = os.path.exists(cookie_path)
             if cookie_exists is True:
                 ytdlopts.update({"cookiefile": cookie_path})
                 # if self.debug is True:
-                logger.debug("  Cookies file used: {}".format(cookie_path))
+                logger.debug("  Cookies file used: %s", cookie_path)
             if cookie_exists is False:
                 logger.warning("  cookie files specified but doesnt exist.")
             return ytdlopts
@@ -381,12 +967,13 @@ class SonarrYTDL(object):
             "playlistreverse": playlistreverse,
             "matchtitle": regextitle,
             "quiet": True,
+            # collects the errors ignoreerrors keeps from raising
+            "logger": YoutubeDLLogger(),
         }
         if self.debug is True:
             ytdlopts.update(
                 {
                     "quiet": False,
-                    "logger": YoutubeDLLogger(),
                     "progress_hooks": [ytdl_hooks],
                 }
             )
@@ -396,9 +983,90 @@ class SonarrYTDL(object):
             logger.debug(ytdlopts)
         return ytdlopts
 
+    def new_ytdl(self, ydl_opts):
+        """Creates a YoutubeDL for ``ytdl_pool``, the listings, searches,
+        downloads and postprocessing all take theirs from the pool"""
+        # imported on first use, a scan with nothing to search never loads yt-dlp
+        import yt_dlp
+
+        return yt_dlp.YoutubeDL(ydl_opts)
+
+    @contextmanager
+    def ytdl(self, ydl_opts, url):
+        """Takes a pooled YoutubeDL once a request to ``url`` is in the budget of
+        the rate governor, backing off if the host throttles it
+        - ``ydl_opts``: Youtube-dl options
+        - ``url``: url the YoutubeDL requests
+        """
+        with self.governor.request(
+            url, ydl_opts.get("cookiefile"), ydl_opts.get("logger")
+        ):
+            with self.ytdl_pool.get(ydl_opts) as ydl:
+                yield ydl
+
+    def ytdl_playlist_opts(self, cookies=None):
+        ytdlopts = {
+            "ignoreerrors": True,
+            "quiet": True,
+            # collects the errors ignoreerrors keeps from raising
+            "logger": YoutubeDLLogger(),
+        }
+        if self.debug is True:
+            ytdlopts.update({"quiet": False})
+        ytdlopts = self.appendcookie(ytdlopts, cookies)
+        if self.debug is True:
+            logger.debug("Youtube-DL opts used for playlist listing")
+            logger.debug(ytdlopts)
+        return ytdlopts
+
+    def ytplaylist(self, ydl_opts, playlist, playlistreverse, incremental=True):
+        """Lists every entry of a playlist or channel without resolving the videos.
+        Uses the playlist cache, only listing entries newer than the cached ones
+        unless the cache is stale or ``incremental`` is False.
+        - ``ydl_opts``: Youtube-dl options used for the listing
+        - ``playlist``: url of the playlist or channel
+        - ``playlistreverse``: return the entries in reverse listing order
+        - ``incremental``: stop listing at the first cached entry
+        returns:
+            ``entries``: list of dicts with id, title, webpage_url and upload_date
+                None if the playlist could not be listed
+        """
+        full = not incremental or self.playlist_cache.is_stale(playlist)
+        known_ids = None if full else self.playlist_cache.known_ids(playlist)
+        span = tracer.span("ytplaylist", "ytdl", url=playlist, full=full)
+        try:
+            with span, self.ytdl(ydl_opts, playlist) as ydl:
+                result = ydl.extract_info(playlist, download=False, process=False)
+                while result is not None and result.get("_type") in [
+                    "url",
+                    "url_transparent",
+                ]:
+                    result = ydl.extract_info(
+                        result["url"],
+                        download=False,
+                        ie_key=result.get("ie_key"),
+                        process=False,
+                    )
+                if result is None:
+                    raise ValueError("No result listing {}".format(playlist))
+                fetched = list(iter_entries(result, known_ids))
+        except Exception as e:
+            logger.error(e)
+            entries = self.playlist_cache.entries(playlist)
+            if entries is not None:
+                logger.warning("    Using cached entries for {}".format(playlist))
+        else:
+            entries = self.playlist_cache.update(playlist, fetched, full)
+        if entries is not None and playlistreverse:
+            entries = entries[::-1]
+        return entries
+
     def ytsearch(self, ydl_opts, playlist):
+        span = tracer.span(
+            "ytsearch", "ytdl", url=playlist, title=ydl_opts.get("matchtitle")
+        )
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            with span, self.ytdl(ydl_opts, playlist) as ydl:
                 result = ydl.extract_info(playlist, download=False)
         except Exception as e:
             logger.error(e)
@@ -422,133 +1090,391 @@ class SonarrYTDL(object):
     def get_episode_filename(self, series, episode):
         logger.debug("Getting episode filename")
 
-        if self.naming_configuration is not None:
+        naming_configuration = series.instance.naming_configuration
+        if naming_configuration is not None:
             template = "/sonarr_root{path}/{seasonFolderFormat}/{standardEpisodeFormat}".format(
-              path = series["path"],
-              seasonFolderFormat = self.naming_configuration["seasonFolderFormat"],
-              standardEpisodeFormat = self.naming_configuration["standardEpisodeFormat"],
+              path = series.path,
+              seasonFolderFormat = naming_configuration["seasonFolderFormat"],
+              standardEpisodeFormat = naming_configuration["standardEpisodeFormat"],
             )
-            logger.debug(f"Converting Sonarr template: {template}")
+            logger.debug("Converting Sonarr template: %s", template)
             template = convert_sonarr_to_python_format(template)
-            logger.debug(f"Using python template: {template}")
+            logger.debug("Using python template: %s", template)
 
             # {Series Title} - s{season:00}e{episode:00} - {Episode Title}
             return template.format(
-                SeriesTitle = sanitize_str(series["title"]),
-                season = episode["seasonNumber"],
-                episode = episode["episodeNumber"],
-                EpisodeTitle = sanitize_str(episode["title"]),
+                SeriesTitle = sanitize_str(series.title),
+                season = episode.season_number,
+                episode = episode.episode_number,
+                EpisodeTitle = sanitize_str(episode.title),
             )
         else:
             return "/sonarr_root{0}/{1}/{2} - S{3:02d}E{4:02d} - {5} - WEB-DL-SonarrYTDL.%(ext)s".format(
-                series["path"],
-                "Specials" if episode["seasonNumber"] == 0 else f"Season {episode['seasonNumber']}",
-                sanitize_str(series["title"]),
-                episode["seasonNumber"],
-                episode["episodeNumber"],
-                sanitize_str(episode["title"]),
+                series.path,
+                "Specials" if episode.season_number == 0 else f"Season {episode.season_number}",
+                sanitize_str(series.title),
+                episode.season_number,
+                episode.episode_number,
+                sanitize_str(episode.title),
             )
 
-    def download(self, series, episodes):
+    def download(self, series, episodes, abort=None):
+        """Searches and downloads the wanted episodes, then rescans their series
+        - ``series``: list of Series
+        - ``episodes``: dict of series id to its list of WantedEpisode
+        - ``abort``: threading.Event stopping the searches and downloads once
+            set, between episodes and while downloading
+        """
         if len(series) != 0:
             logger.info("Processing Wanted Downloads")
-            for s, ser in enumerate(series):
-                logger.info("  {}:".format(ser["title"]))
-                for e, eps in enumerate(episodes):
-                    if ser["id"] == eps["seriesId"]:
-                        cookies = None
-                        url = ser["url"]
-                        if "cookies_file" in ser:
-                            cookies = ser["cookies_file"]
-                        ydleps = self.ytdl_eps_search_opts(
-                            upperescape(eps["title"]), ser["playlistreverse"], cookies
+            results = []
+
+            by_key = {ser.key: ser for ser in series}
+
+            def rescan_downloaded(series_key):
+                """Rescans a series once, after all its episodes are downloaded"""
+                downloaded = [r for r in results if r[0] == series_key and r[3]]
+                if downloaded:
+                    ser = by_key[series_key]
+                    command = self.rescanseries(ser.instance, ser.id)
+                    if command is not None and "id" in command:
+                        self.commands[(ser.instance.name, command["id"])] = (
+                            ser.title,
+                            time.time() + ser.instance.rescan_timeout,
                         )
-                        found, dlurl = self.ytsearch(ydleps, url)
-                        if found:
-                            logger.info(
-                                "    {}: Found - {}:".format(e + 1, eps["title"])
-                            )
-
-                            filename = self.get_episode_filename(ser, eps)
-                            logger.debug(f"Got filename: {filename}")
-
-                            ytdl_format_options = {
-                                "format": self.ytdl_format,
-                                "quiet": True,
-                                "merge-output-format": "mkv",
-                                "outtmpl": filename,
-                                "progress_hooks": [ytdl_hooks],
-                                "noplaylist": True,
-                                "retry_sleep": 5,
-                                "postprocessors": [
-                                    {
-                                        "key": "FFmpegVideoRemuxer",
-                                        "preferedformat": "mkv",
-                                    }
-                                ],
-                            }
-                            ytdl_format_options = self.appendcookie(
-                                ytdl_format_options, cookies
-                            )
-                            if "format" in ser:
-                                ytdl_format_options = self.customformat(
-                                    ytdl_format_options, ser["format"]
-                                )
-                            if "subtitles" in ser:
-                                if ser["subtitles"]:
-                                    ytdl_format_options.update(
-                                        {
-                                            "writesubtitles": True,
-                                            "writeautomaticsub": ser[
-                                                "subtitles_autogenerated"
-                                            ],
-                                            "subtitleslangs": ser[
-                                                "subtitles_languages"
-                                            ],
-                                            "sleep_interval": 2,
-                                            "sleep_interval_requests": 3,
-                                            "retries": 10,
-                                        }
-                                    )
-                                    ytdl_format_options["postprocessors"].append(
-                                        {
-                                            "key": "FFmpegSubtitlesConvertor",
-                                            "format": "srt",
-                                        }
-                                    )
-                                    ytdl_format_options["postprocessors"].append(
-                                        {
-                                            "key": "FFmpegEmbedSubtitle",
-                                        }
-                                    )
-
-                            if self.debug is True:
-                                ytdl_format_options.update(
-                                    {
-                                        "quiet": False,
-                                        "logger": YoutubeDLLogger(),
-                                        "progress_hooks": [ytdl_hooks_debug],
-                                    }
-                                )
-                                logger.debug("Youtube-DL opts used for downloading")
-                                logger.debug(ytdl_format_options)
-                            try:
-                                yt_dlp.YoutubeDL(ytdl_format_options).download([dlurl])
-                                self.rescanseries(ser["id"])
-                                logger.info(
-                                    "      Downloaded - {}".format(eps["title"])
-                                )
-                            except Exception as e:
-                                logger.error(
-                                    "      Failed - {} - {}".format(eps["title"], e)
-                                )
-                        else:
-                            logger.info(
-                                "    {}: Missing - {}:".format(e + 1, eps["title"])
-                            )
+
+            executor = DownloadExecutor(
+                self.download_workers,
+                self.series_workers,
+                self.host_workers,
+                rescan_downloaded,
+                self.postprocess_workers,
+            )
+            searches = []
+            for ser in series:
+                searches.append(
+                    executor.submit(
+                        ser.key,
+                        urllib.parse.urlparse(ser.options.url).hostname,
+                        self.searchseries,
+                        executor,
+                        ser,
+                        list(enumerate(episodes[ser.key])),
+                        results,
+                        abort,
+                    )
+                )
+            executor.shutdown()
+            missing = sum(
+                search.result() for search in searches if search.exception() is None
+            )
+            failed = [result for result in results if not result[3]]
+            wanted = sum(len(wanted) for wanted in episodes.values())
+            metrics.EPISODES.inc(wanted, state="wanted")
+            metrics.LAST_SCAN_EPISODES.set(wanted, state="wanted")
+            metrics.LAST_SCAN_EPISODES.set(len(results), state="found")
+            metrics.LAST_SCAN_EPISODES.set(missing, state="missing")
+            metrics.LAST_SCAN_EPISODES.set(len(failed), state="failed")
+            logger.info(
+                "Downloaded {} of {} episodes".format(
+                    len(results) - len(failed), len(results)
+                )
+            )
+            for _, title, eps_title, _ in failed:
+                logger.error("  Failed - {} - {}".format(title, eps_title))
+            self.playlist_cache.save()
+            for ser in series:
+                ser.instance.not_found.save()
         else:
             logger.info("Nothing to process")
 
+    def searchseries(self, executor, ser, wanted, results, abort=None):
+        """Searches the series url for the wanted episodes and queues the downloads
+        - ``executor``: DownloadExecutor the downloads are submitted to
+        - ``ser``: Series the episodes belong to
+        - ``wanted``: list of (index, WantedEpisode) tuples
+        - ``results``: list the download results are appended to
+        - ``abort``: threading.Event stopping the search once set
+        returns:
+            ``missing``: number of searched episodes that were not found
+        """
+        logger.info("  {}:".format(ser.title))
+        options = ser.options
+        cookies = options.cookies_file
+        url = options.url
+        not_found = ser.instance.not_found
+        jobs = ser.instance.jobs.resumable(ser.id)
+        for e, eps in wanted:
+            if eps.id in jobs:
+                logger.info("    {}: Resuming - {}:".format(e + 1, eps.title))
+                dlurl = jobs[eps.id]["url"]
+                self.submit_download(executor, ser, eps, dlurl, results, abort)
+        wanted = [(e, eps) for e, eps in wanted if eps.id not in jobs]
+        if not wanted:
+            return 0
+        entries = None
+        index = None
+        if options.search_mode == "playlist":
+            with metrics.SEARCH_DURATION.time(series=ser.title):
+                entries = self.ytplaylist(
+                    self.ytdl_playlist_opts(cookies),
+                    url,
+                    options.playlistreverse,
+                    options.playlist_incremental,
+                )
+            if entries is None:
+                logger.warning(
+                    "    Failed to list {}, searching per episode".format(url)
+                )
+            else:
+                logger.debug("    Listed %s entries from %s", len(entries), url)
+                index = self.playlist_cache.signature(url)
+        waiting = len(wanted)
+        wanted = [
+            (e, eps) for e, eps in wanted if not_found.should_search(ser.id, eps, index)
+        ]
+        waiting -= len(wanted)
+        if waiting:
+            logger.info(
+                "    {} missing episodes wait to be searched again".format(waiting)
+            )
+        if entries is not None:
+            candidates = [
+                entry
+                for entry in entries
+                if entry["title"] and entry["webpage_url"] not in [None, url]
+            ]
+            matcher = TitleMatcher({eps.id: eps.title for e, eps in wanted})
+            matches = matcher.match(candidates)
+            if options.fuzzy_threshold is not None and len(matches) < len(wanted):
+                matches.update(self.fuzzymatch(options, wanted, candidates, matches))
+        missing = 0
+        for e, eps in wanted:
+            if abort is not None and abort.is_set():
+                logger.warning("    Stopped searching {}".format(ser.title))
+                break
+            if entries is not None:
+                found = eps.id in matches
+                dlurl = matches[eps.id]["webpage_url"] if found else ""
+            else:
+                ydleps = self.ytdl_eps_search_opts(
+                    upperescape(eps.title), options.playlistreverse, cookies
+                )
+                with metrics.SEARCH_DURATION.time(series=ser.title):
+                    found, dlurl = self.ytsearch(ydleps, url)
+            if found:
+                logger.info("    {}: Found - {}:".format(e + 1, eps.title))
+                metrics.EPISODES.inc(state="found")
+                not_found.found(ser.id, eps)
+                if ser.instance.jobs.matched(ser, eps, dlurl):
+                    self.submit_download(executor, ser, eps, dlurl, results, abort)
+                else:
+                    logger.warning(
+                        "      Not downloading {} again, it failed {} times".format(
+                            dlurl, self.max_attempts
+                        )
+                    )
+            else:
+                logger.info("    {}: Missing - {}:".format(e + 1, eps.title))
+                metrics.EPISODES.inc(state="missing")
+                not_found.missing(ser.id, eps, index)
+                ser.instance.jobs.wanted(ser, eps)
+                missing += 1
+        return missing
+
+    def fuzzymatch(self, options, wanted, candidates, matches):
+        """Matches the episodes the titles did not match by title similarity
+        - ``options``: SeriesOptions of the series
+        - ``wanted``: list of (index, WantedEpisode) tuples
+        - ``candidates``: playlist entries of the series url
+        - ``matches``: dict of episode id to the entry its title matched
+        returns:
+            ``matches``: dict of episode id to the entry found by similarity
+        """
+        taken = {entry["webpage_url"] for entry in matches.values()}
+        unmatched = {eps.id: eps for e, eps in wanted if eps.id not in matches}
+        fuzzy = FuzzyMatcher(
+            [entry for entry in candidates if entry["webpage_url"] not in taken]
+        )
+        found = fuzzy.match(
+            {eps.id: eps.title for eps in unmatched.values()},
+            options.fuzzy_threshold,
+            {
+                eps.id: parse_release(eps.air_date, "%Y-%m-%dT%H:%M:%SZ")
+                for eps in unmatched.values()
+            },
+        )
+        for episode_id, (entry, score) in found.items():
+            logger.info(
+                "    Fuzzy matched {} to {} with a score of {:.2f}".format(
+                    unmatched[episode_id].title, entry["title"], score
+                )
+            )
+        return {episode_id: entry for episode_id, (entry, _) in found.items()}
+
+    def submit_download(self, executor, ser, eps, dlurl, results, abort=None):
+        """Queues the download of a matched episode, keyed by the video host"""
+        executor.submit(
+            ser.key,
+            urllib.parse.urlparse(dlurl).hostname,
+            self.downloadepisode,
+            executor,
+            ser,
+            eps,
+            dlurl,
+            results,
+            abort,
+        )
+
+    def downloadepisode(self, executor, ser, eps, dlurl, results, abort=None):
+        """Downloads a found episode and queues its postprocessing
+        - ``executor``: DownloadExecutor the postprocessing is submitted to
+        - ``ser``: Series the episode belongs to
+        - ``eps``: WantedEpisode to download
+        - ``dlurl``: url of the matched video
+        - ``results``: list a (series key, series title, episode title, success)
+            tuple is appended to
+        - ``abort``: threading.Event stopping the download once set
+        """
+        if abort is not None and abort.is_set():
+            return
+        options = ser.options
+        cookies = options.cookies_file
+        with tracer.span(
+            "get_episode_filename", "app", series=ser.title, episode=eps.title
+        ):
+            filename = self.get_episode_filename(ser, eps)
+        logger.debug("Got filename: %s", filename)
+
+        ytdl_format_options = {
+            "format": self.ytdl_format,
+            "quiet": True,
+            "merge-output-format": "mkv",
+            "outtmpl": filename,
+            "progress_hooks": [ytdl_hooks, metrics.download_hook(ser.title)],
+            "postprocessor_hooks": [
+                ser.instance.jobs.postprocessor_hook(ser.id, eps.id),
+                tracer.postprocessor_hook(series=ser.title, episode=eps.title),
+            ],
+            "continuedl": True,
+            "noplaylist": True,
+            "retry_sleep": 5,
+            "postprocessors": [
+                {
+                    "key": "FFmpegVideoRemuxer",
+                    "preferedformat": "mkv",
+                }
+            ],
+        }
+        ytdl_format_options = self.appendcookie(ytdl_format_options, cookies)
+        if options.format is not None:
+            ytdl_format_options = self.customformat(ytdl_format_options, options.format)
+        if options.subtitles:
+            ytdl_format_options.update(
+                {
+                    "writesubtitles": True,
+                    "writeautomaticsub": options.subtitles_autogenerated,
+                    "subtitleslangs": options.subtitles_languages,
+                    "sleep_interval": 2,
+                    "sleep_interval_requests": 3,
+                    "retries": 10,
+                }
+            )
+            ytdl_format_options["postprocessors"].append(
+                {
+                    "key": "FFmpegSubtitlesConvertor",
+                    "format": "srt",
+                }
+            )
+            ytdl_format_options["postprocessors"].append(
+                {
+                    "key": "FFmpegEmbedSubtitle",
+                }
+            )
+
+        if self.debug is True:
+            ytdl_format_options.update(
+                {
+                    "quiet": False,
+                    "logger": YoutubeDLLogger(),
+                    # progress is logged by ProgressLogger, not per chunk
+                    "noprogress": True,
+                    "progress_hooks": [
+                        ProgressLogger(self.progress_interval),
+                        metrics.download_hook(ser.title),
+                    ],
+                }
+            )
+            logger.debug("Youtube-DL opts used for downloading")
+            logger.debug(ytdl_format_options)
+        if abort is not None:
+
+            def abort_hook(d):
+                if abort.is_set():
+                    raise LeaseLost("Stopped downloading {}".format(eps.title))
+
+            ytdl_format_options["progress_hooks"].append(abort_hook)
+        ser.instance.jobs.start(ser.id, eps.id)
+        # FFmpeg runs on the postprocessing pool, not on this download worker
+        handoff = PostprocessHandOff()
+        try:
+            with tracer.span(
+                "download", "ytdl", series=ser.title, episode=eps.title, url=dlurl
+            ):
+                with self.ytdl(
+                    dict(ytdl_format_options, postprocessors=[]), dlurl
+                ) as ydl:
+                    ydl.add_post_processor(handoff, when="post_process")
+                    ydl.download([dlurl])
+            logger.info("      Downloaded - {}".format(eps.title))
+            metrics.DOWNLOADS.inc(series=ser.title, result="success")
+        except LeaseLost as e:
+            # not a failed attempt, the worker now holding the series resumes it
+            logger.warning("      {}".format(e))
+            ser.instance.jobs.set_state(ser.id, eps.id, jobstore.MATCHED)
+            return
+        except Exception as e:
+            logger.error("      Failed - {} - {}".format(eps.title, e))
+            ser.instance.jobs.failed(ser.id, eps.id, self.max_attempts, str(e))
+            metrics.DOWNLOADS.inc(series=ser.title, result="failure")
+            results.append((ser.key, ser.title, eps.title, False))
+            return
+        executor.submit_postprocess(
+            ser.key,
+            self.postprocessepisode,
+            ser,
+            eps,
+            ytdl_format_options,
+            handoff.infos,
+            results,
+        )
+
+    def postprocessepisode(self, ser, eps, ytdl_format_options, infos, results):
+        """Runs the postprocessors of a downloaded episode
+        - ``ser``: Series the episode belongs to
+        - ``eps``: downloaded WantedEpisode
+        - ``ytdl_format_options``: Youtube-dl options of the download
+        - ``infos``: info dicts of the downloaded files
+        - ``results``: list a (series key, series title, episode title, success)
+            tuple is appended to
+        """
+        try:
+            with tracer.span(
+                "postprocess", "ffmpeg", series=ser.title, episode=eps.title
+            ):
+                # no request is made, so the rate governor is left out
+                with self.ytdl_pool.get(ytdl_format_options) as ydl:
+                    for info in infos:
+                        ydl.post_process(
+                            info["filepath"], info, info.get("__files_to_move")
+                        )
+            ser.instance.jobs.set_state(ser.id, eps.id, jobstore.DOWNLOADED)
+            results.append((ser.key, ser.title, eps.title, True))
+        except Exception as e:
+            logger.error("      Failed postprocessing - {} - {}".format(eps.title, e))
+            ser.instance.jobs.failed(ser.id, eps.id, self.max_attempts, str(e))
+            results.append((ser.key, ser.title, eps.title, False))
+
     def set_scan_interval(self, interval):
         global SCANINTERVAL
         if interval != SCANINTERVAL:
@@ -562,19 +1488,148 @@ class SonarrYTDL(object):
             )
         return
 
+    def close(self):
+        """Closes the pooled YoutubeDLs, saving their cookies"""
+        self.ytdl_pool.close()
+
+
+client = None
 
-def main():
-    client = SonarrYTDL()
-    series = client.filterseries()
-    episodes = client.getseriesepisodes(series)
-    client.download(series, episodes)
+
+def schedule_scans():
+    """(Re)schedules the next scan for when the first series is due"""
+    schedule.clear("scan")
+    delay = client.scan_interval() * 60
+    next_due = client.cadence.next_due()
+    if next_due is not None:
+        delay = max(1, round(next_due - time.time()))
+    schedule.every(delay).seconds.do(main).tag("scan")
+    metrics.SCAN_INTERVAL.set(client.scan_interval() * 60)
+
+
+def main(series_keys=None):
+    """Runs a scan, reusing the client of previous scans. A coordinator queues
+    the wanted episodes for the workers instead of downloading them.
+    - ``series_keys``: only scan the series with these (Sonarr instance name,
+        series id) keys if given, otherwise the series that are due
+    """
+    global client
+    start = time.perf_counter()
+    if client is None:
+        client = SonarrYTDL()
+    else:
+        client.reload()
+    with tracer.span("scan", "app", series_keys=series_keys):
+        with metrics.SCAN_DURATION.time(phase="rescan"):
+            client.check_commands()
+        client.refresh_naming_configuration()
+        with (
+            metrics.SCAN_DURATION.time(phase="filter"),
+            tracer.span("filterseries", "app"),
+        ):
+            series = client.filterseries(series_keys)
+            if series_keys is None:
+                client.cadence.forget(ser.key for ser in series)
+                series = [ser for ser in series if client.cadence.is_due(ser.key)]
+        scanned = list(series)
+        with (
+            metrics.SCAN_DURATION.time(phase="discover"),
+            tracer.span("getseriesepisodes", "app", series=len(series)),
+        ):
+            episodes = client.getseriesepisodes(series)
+        wanted = sum(len(eps) for eps in episodes.values())
+        with (
+            metrics.SCAN_DURATION.time(phase="download"),
+            tracer.span("download_all", "app", series=len(series), episodes=wanted),
+        ):
+            if client.role == "coordinator":
+                client.enqueue(scanned, episodes)
+            else:
+                client.download(series, episodes)
+        client.plan_scans(scanned)
+    if schedule.get_jobs("scan"):
+        schedule_scans()
+    duration = time.perf_counter() - start
+    metrics.SCAN_DURATION.observe(duration, phase="total")
+    metrics.LAST_SCAN_DURATION.set(duration)
+    metrics.LAST_SCAN_TIMESTAMP.set(time.time())
     logger.info("Waiting...")
+    return client
+
+
+def run_worker(worker_id, once=False):
+    """Downloads the series queued by the coordinator
+    - ``worker_id``: id the worker holds its leases with
+    - ``once``: stop once the queue is empty
+    """
+    logger.info("Worker {} waiting for queued series".format(worker_id))
+    while True:
+        client.reload()
+        client.check_commands()
+        try:
+            worked = client.work(worker_id)
+        except Exception as e:
+            logger.error("Failed to download queued series: {}".format(e))
+            worked = False
+        if not worked:
+            if once:
+                client.wait_for_commands()
+                return
+            time.sleep(client.queue_poll)
 
 
 if __name__ == "__main__":
+    args = parse_args()
+    setup_logging(True, True, args.debug)
+    client = SonarrYTDL(refresh_cache=args.refresh_cache, role=args.role)
+    atexit.register(client.close)
+    if args.role == "worker":
+        if args.trace:
+            tracer.start(args.trace)
+        if client.metrics_enabled:
+            MetricsServer(
+                client.metrics_host, client.metrics_port, client.metrics_path
+            ).start()
+        run_worker(args.worker_id, args.once)
+        sys.exit()
     logger.info("Initial run")
-    main()
-    schedule.every(int(SCANINTERVAL)).minutes.do(main)
+    if args.trace:
+        tracer.start(args.trace)
+    if args.profile:
+        profiler.start()
+        with profiler.profile():
+            main()
+        profiler.dump(args.profile)
+    else:
+        main()
+    if args.once:
+        client.wait_for_commands()
+        sys.exit()
+    schedule_scans()
+    webhook = None
+    if client.webhook_enabled:
+        webhook = WebhookServer(
+            client.webhook_host,
+            client.webhook_port,
+            client.webhook_path,
+            client.webhook_username,
+            client.webhook_password,
+        )
+        webhook.start()
+    if client.metrics_enabled:
+        MetricsServer(
+            client.metrics_host, client.metrics_port, client.metrics_path
+        ).start()
     while True:
         schedule.run_pending()
-        time.sleep(1)
+        # sleep until the next scan is due, or a webhook event arrives
+        timeout = max(0, schedule.idle_seconds())
+        if webhook is None:
+            time.sleep(timeout)
+            continue
+        series_keys = webhook.wait(timeout)
+        if series_keys:
+            logger.info(
+                "Scanning {} series from webhook events".format(len(series_keys))
+            )
+            main(series_keys)
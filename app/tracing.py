@@ -0,0 +1,183 @@
+import atexit
+import cProfile
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("sonarr_youtubedl")
+
+
+class Tracer(object):
+    """Records timing spans to a trace file, does nothing until started.
+
+    Spans are written as Chrome trace events, as they complete, so a trace
+    of a scan that never finishes still holds everything done so far. A file
+    ending in .jsonl gets one event per line, anything else a Chrome trace
+    array that can be opened in chrome://tracing or https://ui.perfetto.dev.
+    """
+
+    def __init__(self):
+        self.trace_file = None
+        self.lines = False
+        self.first = True
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+        self.threads = set()
+
+    def start(self, path):
+        """Starts writing spans to ``path``"""
+        self.trace_file = open(path, "w", buffering=1)
+        self.lines = path.endswith(".jsonl")
+        if not self.lines:
+            self.trace_file.write("[\n")
+        atexit.register(self.stop)
+        logger.info("Writing trace to {}".format(path))
+
+    def stop(self):
+        with self.lock:
+            if self.trace_file is None:
+                return
+            if not self.lines:
+                self.trace_file.write("\n]\n")
+            self.trace_file.close()
+            self.trace_file = None
+
+    @property
+    def enabled(self):
+        return self.trace_file is not None
+
+    @contextmanager
+    def span(self, name, category, **attributes):
+        """Times the enclosed block as a span
+        - ``name``: span name
+        - ``category``: span category, e.g. sonarr, ytdl or ffmpeg
+        - ``attributes``: series, episode or other values recorded with the span
+        """
+        if self.trace_file is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.emit(name, category, start, time.perf_counter(), attributes)
+
+    def emit(self, name, category, start, end, attributes):
+        thread = threading.current_thread()
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": round((start - self.origin) * 1000000),
+            "dur": round((end - start) * 1000000),
+            "pid": self.pid,
+            "tid": thread.ident,
+            "args": attributes,
+        }
+        with self.lock:
+            if self.trace_file is None:
+                return
+            if thread.ident not in self.threads:
+                self.threads.add(thread.ident)
+                self.write(
+                    {
+                        "name": "thread_name",
+                        "ph": "M",
+                        "pid": self.pid,
+                        "tid": thread.ident,
+                        "args": {"name": thread.name},
+                    }
+                )
+            self.write(event)
+
+    def write(self, event):
+        """Writes an event, must hold the lock"""
+        line = json.dumps(event, default=str)
+        if self.lines:
+            self.trace_file.write(line + "\n")
+            return
+        if not self.first:
+            line = ",\n" + line
+        self.first = False
+        self.trace_file.write(line)
+
+    def postprocessor_hook(self, **attributes):
+        """Returns a yt-dlp postprocessor hook recording a span per postprocessor"""
+        started = {}
+
+        def hook(d):
+            if self.trace_file is None:
+                return
+            if d["status"] == "started":
+                started[d["postprocessor"]] = time.perf_counter()
+            elif d["status"] == "finished" and d["postprocessor"] in started:
+                self.emit(
+                    d["postprocessor"],
+                    "ffmpeg",
+                    started.pop(d["postprocessor"]),
+                    time.perf_counter(),
+                    attributes,
+                )
+
+        return hook
+
+
+class ScanProfiler(object):
+    """Collects cProfile statistics of a scan, across the threads it runs on.
+
+    Each profiled block gets its own profile as cProfile only follows the
+    thread it was enabled on. Python versions where only one profile can be
+    active at once profile the outermost block, which then covers every
+    thread.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.profiles = []
+
+    def start(self):
+        self.enabled = True
+        self.profiles = []
+
+    @contextmanager
+    def profile(self):
+        if not self.enabled:
+            yield
+            return
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            yield
+            return
+        try:
+            yield
+        finally:
+            profile.disable()
+            with self.lock:
+                self.profiles.append(profile)
+
+    def dump(self, path):
+        """Stops profiling and writes the merged statistics to ``path``"""
+        self.enabled = False
+        with self.lock:
+            profiles, self.profiles = self.profiles, []
+        if not profiles:
+            return
+        stats = pstats.Stats(*profiles)
+        stats.dump_stats(path)
+        logger.info(
+            "Wrote scan profile to {}, read it with python -m pstats {}".format(
+                path, path
+            )
+        )
+
+
+tracer = Tracer()
+profiler = ScanProfiler()
@@ -1,14 +1,15 @@
+import atexit
 import datetime
 import logging
 import os
+import queue
 import re
 import sys
-from logging.handlers import RotatingFileHandler
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 import yaml
 
-CONFIGFILE = os.environ["CONFIGPATH"]
-
 
 def sanitize_str(string):
     """Sanitize string for use in filenames by removing/replacing invalid characters.
@@ -53,18 +54,53 @@ def upperescape(string):
     return string
 
 
-def checkconfig():
+def iter_entries(result, known_ids=None):
+    """Walks a flat yt-dlp playlist result, yielding one dict per video.
+    Channels are returned as nested playlists (one per tab), so those are walked too.
+    Entries are consumed lazily, so stopping early avoids fetching further pages.
+    - ``result``: info dict returned by extract_info
+    - ``known_ids``: ids already indexed, a nested playlist stops at the first one
+    yields:
+        ``entry``: dict with id, title, webpage_url and upload_date
+    """
+    entries = result.get("entries")
+    if entries is None:
+        return
+    for entry in entries:
+        if entry is None:
+            continue
+        if entry.get("_type") == "playlist":
+            yield from iter_entries(entry, known_ids)
+            continue
+        if known_ids and entry.get("id") in known_ids:
+            return
+        upload_date = entry.get("upload_date")
+        timestamp = entry.get("timestamp") or entry.get("release_timestamp")
+        if upload_date is None and timestamp is not None:
+            upload_date = datetime.datetime.fromtimestamp(
+                timestamp, datetime.timezone.utc
+            ).strftime("%Y%m%d")
+        yield {
+            "id": entry.get("id"),
+            "title": entry.get("title"),
+            "webpage_url": entry.get("webpage_url") or entry.get("url"),
+            "upload_date": upload_date,
+        }
+
+
+def checkconfig(config_file):
     """Checks if config files exist in config path
     If no config available, will copy template to config folder and exit script
+    - ``config_file``: path of config.yml
 
     returns:
 
         `cfg`: dict containing configuration values
     """
     logger = logging.getLogger("sonarr_youtubedl")
-    config_template = os.path.abspath(CONFIGFILE + ".template")
+    config_template = os.path.abspath(config_file + ".template")
     config_template_exists = os.path.exists(os.path.abspath(config_template))
-    config_file = os.path.abspath(CONFIGFILE)
+    config_file = os.path.abspath(config_file)
     config_file_exists = os.path.exists(os.path.abspath(config_file))
     if not config_file_exists:
         logger.critical(
@@ -114,6 +150,8 @@ def offsethandler(airdate, offset):
 class YoutubeDLLogger(object):
     def __init__(self):
         self.logger = logging.getLogger("sonarr_youtubedl")
+        # warnings and errors, also those of the entries yt-dlp ignores
+        self.reported = []
 
     def info(self, msg: str) -> None:
         self.logger.info(msg)
@@ -122,24 +160,62 @@ class YoutubeDLLogger(object):
         self.logger.debug(msg)
 
     def warning(self, msg: str) -> None:
+        self.reported.append(msg)
         self.logger.info(msg)
 
     def error(self, msg: str) -> None:
+        self.reported.append(msg)
         self.logger.error(msg)
 
 
-def ytdl_hooks_debug(d):
-    logger = logging.getLogger("sonarr_youtubedl")
-    if d["status"] == "finished":
-        file_tuple = os.path.split(os.path.abspath(d["filename"]))
-        logger.info(
-            "      Done downloading {}".format(file_tuple[1])
-        )  # print("Done downloading {}".format(file_tuple[1]))
-    if d["status"] == "downloading":
-        progress = "      {} - {} - {}".format(
-            d["filename"], d["_percent_str"], d["_eta_str"]
-        )
-        logger.debug(progress)
+class PostprocessHandOff(object):
+    """yt-dlp post_process step keeping the info of every downloaded file, so its
+    postprocessors can run afterwards on another YoutubeDL with post_process"""
+
+    def __init__(self):
+        self.infos = []
+
+    def set_downloader(self, downloader):
+        pass
+
+    def run(self, info):
+        self.infos.append(dict(info))
+        return [], info
+
+
+class ProgressLogger(object):
+    """yt-dlp progress hook logging the progress of a download at debug level,
+    at most once every ``interval`` seconds per downloaded file, yt-dlp calls
+    it for every chunk it writes"""
+
+    def __init__(self, interval=10):
+        """
+        - ``interval``: minimum seconds between progress lines of a file
+        """
+        self.interval = interval
+        self.logger = logging.getLogger("sonarr_youtubedl")
+        self.logged = {}
+
+    def __call__(self, d):
+        filename = d.get("filename")
+        if d["status"] == "finished":
+            self.logged.pop(filename, None)
+            self.logger.info(
+                "      Done downloading %s", os.path.basename(os.path.abspath(filename))
+            )
+        elif d["status"] == "downloading":
+            if not self.logger.isEnabledFor(logging.DEBUG):
+                return
+            now = time.monotonic()
+            if now - self.logged.get(filename, -self.interval) < self.interval:
+                return
+            self.logged[filename] = now
+            self.logger.debug(
+                "      %s - %s - %s",
+                filename,
+                d.get("_percent_str", "?").strip(),
+                d.get("_eta_str", "?").strip(),
+            )
 
 
 def ytdl_hooks(d):
@@ -149,7 +225,16 @@ def ytdl_hooks(d):
         logger.info("      Downloaded - {}".format(file_tuple[1]))
 
 
+# writes the queued log records to the handlers set up by setup_logging
+log_listener = None
+
+
 def setup_logging(lf_enabled=True, lc_enabled=True, debugging=False):
+    """Sets up the log file and console handlers. Records are queued and
+    written by a background thread, so a slow disk or console never holds
+    up the thread logging.
+    """
+    global log_listener
     log_level = logging.INFO
     log_level = logging.DEBUG if debugging else log_level
     logger = logging.getLogger("sonarr_youtubedl")
@@ -157,6 +242,7 @@ def setup_logging(lf_enabled=True, lc_enabled=True, debugging=False):
     log_format = logging.Formatter(
         "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
     )
+    handlers = []
 
     if lf_enabled:
         # setup logfile
@@ -168,7 +254,7 @@ def setup_logging(lf_enabled=True, lc_enabled=True, debugging=False):
         loggerfile.setLevel(log_level)
         loggerfile.set_name("FileHandler")
         loggerfile.setFormatter(log_format)
-        logger.addHandler(loggerfile)
+        handlers.append(loggerfile)
 
     if lc_enabled:
         # setup console log
@@ -176,10 +262,39 @@ def setup_logging(lf_enabled=True, lc_enabled=True, debugging=False):
         loggerconsole.setLevel(log_level)
         loggerconsole.set_name("StreamHandler")
         loggerconsole.setFormatter(log_format)
-        logger.addHandler(loggerconsole)
-
+        handlers.append(loggerconsole)
+
+    if log_listener is not None:
+        log_listener.stop()
+    for handler in logger.handlers[:]:
+        if isinstance(handler, QueueHandler):
+            logger.removeHandler(handler)
+    records = queue.SimpleQueue()
+    loggerqueue = QueueHandler(records)
+    loggerqueue.set_name("QueueHandler")
+    logger.addHandler(loggerqueue)
+    log_listener = QueueListener(records, *handlers, respect_handler_level=True)
+    log_listener.start()
     return logger
 
+
+def log_handlers(logger):
+    """Returns the handlers of ``logger``, with those writing its queued records"""
+    handlers = list(logger.handlers)
+    if log_listener is not None:
+        handlers.extend(log_listener.handlers)
+    return handlers
+
+
+@atexit.register
+def stop_logging():
+    """Writes the records still queued before the interpreter exits"""
+    global log_listener
+    if log_listener is not None:
+        log_listener.stop()
+        log_listener = None
+
+
 def remove_spaces_in_braces(text):
     # Pattern matches { followed by any characters including spaces, then }
     # The (?<=...) is a positive lookbehind, (?=...) is a positive lookahead
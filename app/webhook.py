@@ -0,0 +1,141 @@
+import base64
+import json
+import logging
+import queue
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("sonarr_youtubedl")
+
+# Sonarr events that can't leave an episode of the series wanted
+IGNORED_EVENTS = [
+    "Test",
+    "SeriesDelete",
+    "Health",
+    "HealthRestored",
+    "ApplicationUpdate",
+]
+
+
+class WebhookServer(object):
+    """Embedded HTTP listener for Sonarr's webhook connection.
+
+    Every event naming a series queues that series, the main loop picks
+    them up with ``wait`` and scans just those series. With several Sonarr
+    instances each posts to the path with ``?instance=<name>``, events
+    without it match the series id on every instance.
+    """
+
+    def __init__(self, host, port, path="/webhook", username=None, password=None):
+        """
+        - ``host``: address to listen on
+        - ``port``: port to listen on
+        - ``path``: url path Sonarr posts to
+        - ``username``: optional basic auth username set in Sonarr
+        - ``password``: optional basic auth password set in Sonarr
+        """
+        self.events = queue.Queue()
+        self.path = path
+        self.authorization = None
+        if username:
+            credentials = "{}:{}".format(username, password or "")
+            self.authorization = "Basic " + base64.b64encode(
+                credentials.encode()
+            ).decode("ascii")
+        self.server = ThreadingHTTPServer((host, port), self.handler())
+        self.thread = None
+
+    def handler(self):
+        webhook = self
+
+        class WebhookHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                logger.debug("Webhook " + format, *args)
+
+            def do_POST(self):
+                url = urllib.parse.urlparse(self.path)
+                if url.path != webhook.path:
+                    self.send_error(404)
+                    return
+                if (
+                    webhook.authorization is not None
+                    and self.headers.get("Authorization") != webhook.authorization
+                ):
+                    self.send_error(401)
+                    return
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    payload = json.loads(self.rfile.read(length))
+                except ValueError:
+                    self.send_error(400)
+                    return
+                instance = urllib.parse.parse_qs(url.query).get("instance")
+                if not webhook.receive(payload, instance[0] if instance else None):
+                    self.send_error(400)
+                    return
+                self.send_response(202)
+                self.end_headers()
+
+        return WebhookHandler
+
+    def receive(self, payload, instance=None):
+        """Queues the series a Sonarr event names
+        - ``payload``: decoded json body of the event
+        - ``instance``: name of the Sonarr instance that posted it, or None
+        returns:
+            ``bool``: False if the payload is not a Sonarr event
+        """
+        if not isinstance(payload, dict):
+            logger.warning("Webhook payload is not a json object")
+            return False
+        event = payload.get("eventType", "")
+        series = payload.get("series") or {}
+        if not isinstance(series, dict):
+            logger.warning("Webhook {} event series is not a json object".format(event))
+            return False
+        if event in IGNORED_EVENTS or "id" not in series:
+            logger.debug("Webhook ignored %s event", event)
+            return True
+        logger.info(
+            "Webhook {} event for {}".format(event, series.get("title", series["id"]))
+        )
+        self.events.put((instance, series["id"]))
+        return True
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, name="webhook", daemon=True
+        )
+        self.thread.start()
+        logger.info(
+            "Listening for Sonarr webhooks on port {}{}".format(
+                self.server.server_address[1], self.path
+            )
+        )
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def wait(self, timeout, debounce=5):
+        """Waits for webhook events
+        - ``timeout``: seconds to wait for a first event
+        - ``debounce``: seconds to keep collecting events once one arrived,
+            as Sonarr sends one event per episode
+        returns:
+            ``series_keys``: set of (Sonarr instance name, series id) with
+                events, the name None if not given, empty on timeout
+        """
+        series_keys = set()
+        try:
+            series_keys.add(self.events.get(timeout=timeout))
+        except queue.Empty:
+            return series_keys
+        deadline = time.time() + debounce
+        while True:
+            try:
+                series_keys.add(self.events.get(timeout=max(0, deadline - time.time())))
+            except queue.Empty:
+                return series_keys
@@ -0,0 +1,195 @@
+import logging
+import os
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+import metrics
+
+logger = logging.getLogger("sonarr_youtubedl")
+
+# options changing with every use, set on a pooled YoutubeDL instead of keying it
+PER_USE = ["outtmpl", "matchtitle", "playlistreverse", "logger"]
+HOOKS = ["progress_hooks", "postprocessor_hooks"]
+# YoutubeDL internals reset between uses, yt-dlp has no public way to
+# remove hooks or post processors once added
+INTERNALS = {
+    "_pps": dict,
+    "_progress_hooks": list,
+    "_postprocessor_hooks": list,
+}
+
+
+class YoutubeDLPool(object):
+    """Long-lived YoutubeDLs shared by searches and downloads with the same options.
+
+    A YoutubeDL is created once per set of effective options, like the cookie
+    file, format and subtitle settings, and kept with its cookie jar,
+    extractor instances and open HTTP connections. A thread takes a YoutubeDL
+    for the duration of a listing, search or download, so no two threads use
+    one at the same time, and more are created while every one is taken. The
+    output template, title filter and hooks are set on it for each use.
+
+    The cookies are saved after each use, like closing a YoutubeDL does. If
+    the cookie file is changed by anything else, the YoutubeDLs that loaded it
+    are dropped so the new cookies are used.
+
+    Resetting a YoutubeDL between uses relies on yt-dlp internals. If a yt-dlp
+    update drops them, every use gets a new YoutubeDL instead, closed after.
+    """
+
+    def __init__(self, factory):
+        """
+        - ``factory``: function creating a YoutubeDL from its options
+        """
+        self.factory = factory
+        self.lock = threading.Lock()
+        self.idle = defaultdict(list)
+        # cookie file path to its mtime and generation of YoutubeDLs using it
+        self.cookies = {}
+        # whether the YoutubeDLs of this yt-dlp version can be reset, None
+        # until the first one is created
+        self.reusable = None
+
+    def key(self, ydl_opts):
+        """Returns the options of a YoutubeDL that can't change between uses"""
+        key = []
+        for name, value in sorted(ydl_opts.items()):
+            if name in PER_USE or name in HOOKS:
+                continue
+            key.append((name, repr(value)))
+        return tuple(key)
+
+    def generation(self, cookiefile):
+        """Returns the generation of the YoutubeDLs loading ``cookiefile`` now,
+        a new one if the file changed since the last YoutubeDL saved it"""
+        if cookiefile is None:
+            return 0
+        try:
+            mtime = os.path.getmtime(cookiefile)
+        except OSError:
+            mtime = None
+        known, generation = self.cookies.get(cookiefile, (mtime, 0))
+        if known != mtime:
+            generation += 1
+            logger.debug("Cookie file %s changed, reloading it", cookiefile)
+            for key in list(self.idle):
+                if dict(key).get("cookiefile") == repr(cookiefile):
+                    for pooled in self.idle.pop(key):
+                        self.discard(pooled)
+        self.cookies[cookiefile] = (mtime, generation)
+        return generation
+
+    @contextmanager
+    def get(self, ydl_opts):
+        """Takes a YoutubeDL with ``ydl_opts`` until the block ends
+        - ``ydl_opts``: Youtube-dl options
+        """
+        key = self.key(ydl_opts)
+        cookiefile = ydl_opts.get("cookiefile")
+        with self.lock:
+            generation = self.generation(cookiefile)
+            pooled = self.idle[key].pop() if self.idle[key] else None
+        if pooled is None:
+            # YoutubeDL keeps and changes the dict of options it is given
+            ydl = self.factory(dict(ydl_opts))
+            if self.reusable is None:
+                self.reusable = self.supports(ydl)
+            if not self.reusable:
+                metrics.YTDL_INSTANCES.inc(result="created")
+                try:
+                    yield ydl
+                finally:
+                    try:
+                        ydl.close()
+                    except Exception as e:
+                        logger.error("Failed to close YoutubeDL: {}".format(e))
+                return
+            # post processors of the options, add_post_processor appends per use
+            pps = {when: list(pps) for when, pps in ydl._pps.items()}
+            pooled = (ydl, pps, generation)
+            metrics.YTDL_INSTANCES.inc(result="created")
+        else:
+            ydl = pooled[0]
+            metrics.YTDL_INSTANCES.inc(result="reused")
+        self.prepare(pooled, ydl_opts)
+        try:
+            yield ydl
+        finally:
+            self.release(key, cookiefile, pooled)
+
+    def supports(self, ydl):
+        """Returns True if a YoutubeDL of this yt-dlp version can be reset"""
+        missing = [
+            name
+            for name, kind in INTERNALS.items()
+            if not isinstance(getattr(ydl, name, None), kind)
+        ]
+        if not callable(getattr(ydl, "_parse_outtmpl", None)):
+            missing.append("_parse_outtmpl")
+        if missing:
+            logger.warning(
+                "Not reusing YoutubeDLs, this yt-dlp has no {}".format(
+                    ", ".join(missing)
+                )
+            )
+        return not missing
+
+    def prepare(self, pooled, ydl_opts):
+        """Sets the options of this use on a pooled YoutubeDL"""
+        ydl, pps, _ = pooled
+        for name in PER_USE:
+            if name in ydl_opts:
+                ydl.params[name] = ydl_opts[name]
+            else:
+                ydl.params.pop(name, None)
+        # turns a template string into the dict of templates yt-dlp uses
+        ydl._parse_outtmpl()
+        ydl._pps = {when: list(pps) for when, pps in pps.items()}
+        # the downloaders and post processors created for this use take these
+        ydl._progress_hooks = []
+        ydl._postprocessor_hooks = []
+        for hook in ydl_opts.get("progress_hooks", []):
+            ydl.add_progress_hook(hook)
+        for hook in ydl_opts.get("postprocessor_hooks", []):
+            ydl.add_postprocessor_hook(hook)
+
+    def release(self, key, cookiefile, pooled):
+        ydl, _, generation = pooled
+        with self.lock:
+            if cookiefile is not None:
+                mtime, current = self.cookies[cookiefile]
+                if generation != current:
+                    self.discard(pooled)
+                    return
+                try:
+                    ydl.save_cookies()
+                    self.cookies[cookiefile] = (
+                        os.path.getmtime(cookiefile),
+                        current,
+                    )
+                except Exception as e:
+                    logger.error("Failed to save cookies: {}".format(e))
+            self.idle[key].append(pooled)
+
+    def discard(self, pooled):
+        """Closes a YoutubeDL without saving the cookies it loaded"""
+        ydl = pooled[0]
+        ydl.params["cookiefile"] = None
+        try:
+            ydl.close()
+        except Exception as e:
+            logger.error("Failed to close YoutubeDL: {}".format(e))
+
+    def close(self):
+        """Closes every idle YoutubeDL, saving its cookies"""
+        with self.lock:
+            idle = [pooled for pools in self.idle.values() for pooled in pools]
+            self.idle.clear()
+        for ydl, _, _ in idle:
+            try:
+                ydl.close()
+            except Exception as e:
+                logger.error("Failed to close YoutubeDL: {}".format(e))
+        if idle:
+            logger.debug("Closed %s pooled YoutubeDLs", len(idle))
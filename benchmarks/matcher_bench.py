@@ -0,0 +1,136 @@
+"""Micro-benchmark of episode title matching against a listed playlist.
+
+Compares the per-episode regex scan (what yt-dlp's matchtitle does for every
+wanted episode) with the TitleMatcher single pass, as the number of wanted
+episodes and the playlist size grow. Then times the FuzzyMatcher on reworded
+episode titles the regexes miss, and counts how many it matches correctly and
+how many episodes missing from the playlist it wrongly matches.
+
+    python benchmarks/matcher_bench.py
+"""
+
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from matcher import FuzzyMatcher, TitleMatcher  # noqa: E402
+from utils import upperescape  # noqa: E402
+
+WORDS = (
+    "the a of and in on my how we built tiny house day night last first big "
+    "little road trip cooking bread garden winter summer review build part "
+    "challenge secret lost found city river mountain chicken robot guitar "
+    "camera drone boat island forest desert storm fire ice speed slow motion "
+    "water balloon pizza rocket"
+).split()
+
+
+def synthetic_titles(count, rng):
+    titles = set()
+    while len(titles) < count:
+        words = rng.choices(WORDS, k=rng.randint(3, 9))
+        titles.add("{} #{}".format(" ".join(words).title(), rng.randint(1, 9999)))
+    return sorted(titles)
+
+
+def per_episode_scan(episodes, entries):
+    matches = {}
+    for key, title in episodes.items():
+        regextitle = upperescape(title)
+        for entry in entries:
+            if re.search(regextitle, entry["title"], re.IGNORECASE):
+                matches[key] = entry
+                break
+    return matches
+
+
+def single_pass(episodes, entries):
+    return TitleMatcher(episodes).match(entries)
+
+
+def reworded(title, rng):
+    """Drops, swaps or misspells a word of a title, keeping its number"""
+    words, number = title.rsplit(" ", 1)
+    words = words.split()
+    i = rng.randrange(len(words))
+    change = rng.choice(["drop", "swap", "typo"])
+    if change == "drop" and len(words) > 3:
+        del words[i]
+    elif change == "swap" and len(words) > 1:
+        j = (i + 1) % len(words)
+        words[i], words[j] = words[j], words[i]
+    elif len(words[i]) > 3:
+        words[i] = words[i][:-2] + words[i][-1] + words[i][-2]
+    return "{} {}".format(" ".join(words).lower(), number)
+
+
+def fuzzy(episodes, entries, threshold):
+    return FuzzyMatcher(entries).match(episodes, threshold)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    rng = random.Random(42)
+    print(
+        "{:>8} {:>8} {:>14} {:>14} {:>8}".format(
+            "episodes", "videos", "per-episode s", "single-pass s", "speedup"
+        )
+    )
+    for videos in [200, 2000, 10000]:
+        titles = synthetic_titles(videos, rng)
+        entries = [{"title": title} for title in titles]
+        for wanted in [10, 100, 1000]:
+            # half of the wanted episodes are in the playlist, half are missing
+            present = rng.sample(titles, min(wanted // 2, videos))
+            missing = synthetic_titles(wanted - len(present), random.Random(wanted))
+            episodes = dict(enumerate(present + missing))
+            slow, expected = timed(per_episode_scan, episodes, entries)
+            fast, result = timed(single_pass, episodes, entries)
+            assert result == expected
+            print(
+                "{:>8} {:>8} {:>14.4f} {:>14.4f} {:>7.1f}x".format(
+                    wanted, videos, slow, fast, slow / fast
+                )
+            )
+
+    for threshold in [0.6, 0.75]:
+        print()
+        print("fuzzy matching of reworded titles, threshold {}".format(threshold))
+        print(
+            "{:>8} {:>8} {:>14} {:>8} {:>8}".format(
+                "episodes", "videos", "fuzzy s", "correct", "wrong"
+            )
+        )
+        for videos in [200, 2000, 10000]:
+            titles = synthetic_titles(videos, rng)
+            entries = [{"title": title} for title in titles]
+            for wanted in [10, 100, 1000]:
+                present = rng.sample(titles, min(wanted // 2, videos))
+                missing = synthetic_titles(wanted - len(present), random.Random(wanted))
+                originals = dict(enumerate(present + missing))
+                episodes = {
+                    key: reworded(title, rng) for key, title in originals.items()
+                }
+                seconds, result = timed(fuzzy, episodes, entries, threshold)
+                correct = sum(
+                    entry["title"] == originals[key]
+                    for key, (entry, _) in result.items()
+                )
+                print(
+                    "{:>8} {:>8} {:>14.4f} {:>8} {:>8}".format(
+                        wanted, videos, seconds, correct, len(result) - correct
+                    )
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""End-to-end scan benchmark against offline Sonarr and YouTube stand-ins.
+
+Runs full scans (filterseries, getseriesepisodes and download) of a synthetic
+library and reports wall time per phase, Sonarr round-trips, extractor calls
+and peak Python heap. Downloads are simulated: the video is extracted and a
+format selected, but nothing is written.
+
+    python benchmarks/scan_bench.py --series 50 --episodes 200 --scans 3
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+
+import yaml
+
+APP = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "app"))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--series", type=int, default=10, help="series in Sonarr")
+    parser.add_argument("--episodes", type=int, default=50, help="episodes per series")
+    parser.add_argument(
+        "--missing", type=float, default=0.2, help="share of episodes without file"
+    )
+    parser.add_argument(
+        "--found", type=float, default=0.5, help="share of missing episodes online"
+    )
+    parser.add_argument(
+        "--playlist-size", type=int, default=500, help="videos per series playlist"
+    )
+    parser.add_argument(
+        "--page-size", type=int, default=100, help="videos per playlist page"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="seconds per playlist page"
+    )
+    parser.add_argument("--scans", type=int, default=2, help="scans to run")
+    parser.add_argument("--workers", type=int, default=1, help="ytdl workers")
+    parser.add_argument(
+        "--search-mode", default="playlist", choices=["playlist", "episode"]
+    )
+    parser.add_argument(
+        "--episode-discovery", default="missing", choices=["missing", "series"]
+    )
+    parser.add_argument("--verbose", action="store_true", help="show the scan logs")
+    return parser.parse_args()
+
+
+def write_config(path, options, library, port):
+    cfg = {
+        "sonarrytdl": {
+            "scan_interval": "1",
+            "debug": "False",
+            "search_mode": options.search_mode,
+            "episode_discovery": options.episode_discovery,
+        },
+        "sonarr": {
+            "host": "127.0.0.1",
+            "port": str(port),
+            "apikey": "bench",
+            "ssl": "false",
+            "version": "v4",
+        },
+        "ytdl": {"default_format": "best", "workers": str(options.workers)},
+        # the stand-ins never throttle, keep the rate governor out of the timings
+        "ratelimit": {"requests_per_minute": "1000000", "burst": "1000000"},
+        "series": [
+            {"title": ser["title"], "url": library.playlist_url(ser["id"])}
+            for ser in library.series
+        ],
+    }
+    with open(path, "w") as ymlfile:
+        yaml.safe_dump(cfg, ymlfile)
+
+
+def main():
+    options = parse_args()
+    workdir = tempfile.mkdtemp(prefix="sonarr_youtubedl_bench_")
+    os.environ["CONFIGPATH"] = os.path.join(workdir, "config.yml")
+    sys.path.insert(0, APP)
+
+    import sonarr_youtubedl
+    import yt_dlp
+    from standin import FakePlaylistIE, Library, SonarrStandIn
+    from utils import setup_logging
+
+    logger = setup_logging(False, True)
+    if not options.verbose:
+        logger.setLevel(logging.WARNING)
+
+    library = Library(
+        options.series,
+        options.episodes,
+        options.missing,
+        options.found,
+        options.playlist_size,
+        options.page_size,
+        options.latency,
+    )
+    standin = SonarrStandIn(library).start()
+    FakePlaylistIE.library = library
+    FakePlaylistIE.media_url = "http://127.0.0.1:{}/api/v3/media".format(standin.port)
+    write_config(os.environ["CONFIGPATH"], options, library, standin.port)
+    phases = Counter()
+
+    class BenchSonarrYTDL(sonarr_youtubedl.SonarrYTDL):
+        def new_ytdl(self, ydl_opts):
+            ydl = yt_dlp.YoutubeDL(dict(ydl_opts, simulate=True), auto_init=False)
+            ydl.add_info_extractor(FakePlaylistIE())
+            return ydl
+
+        def timed(self, phase, fn, *args):
+            start = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                phases[phase] += time.perf_counter() - start
+
+        def filterseries(self, series_ids=None):
+            return self.timed("filter", super().filterseries, series_ids)
+
+        def getseriesepisodes(self, series):
+            return self.timed("discover", super().getseriesepisodes, series)
+
+        def download(self, series, episodes):
+            return self.timed("download", super().download, series, episodes)
+
+    print(
+        "{} series x {} episodes, {} videos per playlist, {} workers, "
+        "{} search, {} discovery".format(
+            options.series,
+            options.episodes,
+            options.playlist_size,
+            options.workers,
+            options.search_mode,
+            options.episode_discovery,
+        )
+    )
+    print(
+        "{:>4} {:>8} {:>8} {:>8} {:>8} {:>7} {:>7} {:>7} {:>8}".format(
+            "scan",
+            "wall s",
+            "filter",
+            "discover",
+            "download",
+            "sonarr",
+            "pages",
+            "videos",
+            "peak MiB",
+        )
+    )
+    tracemalloc.start()
+    sonarr_youtubedl.client = BenchSonarrYTDL()
+    for scan in range(1, options.scans + 1):
+        phases.clear()
+        library.stats.clear()
+        tracemalloc.reset_peak()
+        # every scan covers the whole library, whatever the release cadence
+        sonarr_youtubedl.client.cadence.due.clear()
+        start = time.perf_counter()
+        sonarr_youtubedl.main()
+        wall = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        stats = library.stats
+        print(
+            "{:>4} {:>8.3f} {:>8.3f} {:>8.3f} {:>8.3f} {:>7} {:>7} {:>7} {:>8.1f}".format(
+                scan,
+                wall,
+                phases["filter"],
+                phases["discover"],
+                phases["download"],
+                sum(v for k, v in stats.items() if k.startswith("sonarr")),
+                stats["extractor page"],
+                stats["extractor video"],
+                peak,
+            )
+        )
+        for key in sorted(k for k in stats if k.startswith("sonarr")):
+            print("       {:<30} {:>6}".format(key, stats[key]))
+    standin.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""Offline stand-ins for Sonarr and YouTube used by the benchmarks.
+
+``SonarrStandIn`` serves the Sonarr endpoints sonarr_youtubedl calls from a
+synthetic library and counts every round-trip. ``FakePlaylistIE`` is a yt-dlp
+extractor serving the matching synthetic playlists with a configurable page
+size and latency, counting playlist pages and video extractions.
+"""
+
+import json
+import random
+import threading
+import time
+import urllib.parse
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from yt_dlp.extractor.common import InfoExtractor
+
+WORDS = (
+    "how we built tiny house day night last first big little road trip cooking "
+    "bread garden winter summer review build part challenge secret lost found "
+    "city river mountain chicken robot guitar camera drone boat island forest "
+    "desert storm fire ice speed slow motion water balloon pizza rocket"
+).split()
+
+
+class Library(object):
+    """Synthetic Sonarr library and the playlists its episodes are found in"""
+
+    def __init__(
+        self,
+        series=10,
+        episodes=50,
+        missing=0.2,
+        found=0.5,
+        playlist_size=500,
+        page_size=100,
+        latency=0.0,
+        seed=42,
+    ):
+        """
+        - ``series``: number of series
+        - ``episodes``: episodes per series
+        - ``missing``: share of the episodes without a file in Sonarr
+        - ``found``: share of the missing episodes present in the playlist
+        - ``playlist_size``: videos per series playlist
+        - ``page_size``: videos per playlist page
+        - ``latency``: seconds spent fetching each playlist page
+        """
+        rng = random.Random(seed)
+        self.page_size = page_size
+        self.latency = latency
+        self.series = []
+        self.episodes = {}
+        self.playlists = {}
+        self.videos = {}
+        self.stats = Counter()
+        self.lock = threading.Lock()
+        for s in range(1, series + 1):
+            title = "Bench Series {}".format(s)
+            self.series.append(
+                {
+                    "id": s,
+                    "title": title,
+                    "path": "/tv/{}".format(title),
+                    "monitored": True,
+                    "seasonCount": 1,
+                    "images": [{"coverType": "poster", "url": "/poster.jpg"}],
+                    "alternateTitles": [],
+                    "statistics": {"episodeCount": episodes},
+                }
+            )
+            eps_list = []
+            videos = []
+            for e in range(1, episodes + 1):
+                eps_title = "{} #{}-{}".format(
+                    " ".join(rng.choices(WORDS, k=rng.randint(3, 7))).title(), s, e
+                )
+                has_file = rng.random() >= missing
+                eps_list.append(
+                    {
+                        "id": s * 100000 + e,
+                        "seriesId": s,
+                        "seasonNumber": 1,
+                        "episodeNumber": e,
+                        "title": eps_title,
+                        "airDateUtc": "2020-01-01T00:00:00Z",
+                        "monitored": True,
+                        "hasFile": has_file,
+                        "overview": " ".join(rng.choices(WORDS, k=40)),
+                    }
+                )
+                if has_file or rng.random() < found:
+                    videos.append(eps_title)
+            while len(videos) < playlist_size:
+                videos.append(
+                    "{} #{}".format(
+                        " ".join(rng.choices(WORDS, k=rng.randint(3, 9))).title(),
+                        rng.randint(1, 99999),
+                    )
+                )
+            rng.shuffle(videos)
+            ids = []
+            for v, video_title in enumerate(videos):
+                video_id = "s{}v{}".format(s, v)
+                self.videos[video_id] = video_title
+                ids.append(video_id)
+            self.episodes[s] = eps_list
+            self.playlists["series{}".format(s)] = ids
+
+    def playlist_url(self, series_id):
+        return "fakeyt://playlist/series{}".format(series_id)
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+
+class FakePlaylistIE(InfoExtractor):
+    IE_NAME = "fakeyt"
+    _VALID_URL = r"fakeyt://(?P<kind>playlist|video)/(?P<id>[^/?#]+)"
+    library = None
+    media_url = None
+
+    def _real_extract(self, url):
+        kind, item_id = self._match_valid_url(url).group("kind", "id")
+        library = self.library
+        if kind == "video":
+            library.count("extractor video")
+            return {
+                "id": item_id,
+                "title": library.videos[item_id],
+                "formats": [{"format_id": "fake", "url": self.media_url, "ext": "mp4"}],
+            }
+
+        library.count("extractor playlist")
+        ids = library.playlists[item_id]
+
+        def entries():
+            for start in range(0, len(ids), library.page_size):
+                time.sleep(library.latency)
+                library.count("extractor page")
+                for video_id in ids[start : start + library.page_size]:
+                    yield self.url_result(
+                        "fakeyt://video/{}".format(video_id),
+                        FakePlaylistIE,
+                        video_id,
+                        library.videos[video_id],
+                    )
+
+        return self.playlist_result(entries(), item_id, item_id)
+
+
+class SonarrStandIn(object):
+    """HTTP server answering the Sonarr api calls from a Library"""
+
+    def __init__(self, library):
+        self.library = library
+        self.commands = {}
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler())
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get(self, path, query):
+        library = self.library
+        if path == "/series":
+            return library.series
+        if path == "/config/naming":
+            return {
+                "seasonFolderFormat": "Season {season}",
+                "standardEpisodeFormat": "{Series Title} - S{season:00}E{episode:00}"
+                " - {Episode Title}",
+            }
+        if path == "/episode":
+            return library.episodes.get(int(query["seriesId"]), [])
+        if path == "/episodefile":
+            return []
+        if path == "/wanted/missing":
+            records = [
+                eps
+                for episodes in library.episodes.values()
+                for eps in episodes
+                if eps["monitored"] and not eps["hasFile"]
+            ]
+            page = int(query.get("page", 1))
+            page_size = int(query.get("pageSize", 10))
+            return {
+                "page": page,
+                "pageSize": page_size,
+                "totalRecords": len(records),
+                "records": records[(page - 1) * page_size : page * page_size],
+            }
+        if path.startswith("/command/"):
+            return self.commands.get(int(path.split("/")[-1]))
+        return None
+
+    def handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def respond(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def route(self):
+                parsed = urllib.parse.urlparse(self.path)
+                path = parsed.path.split("/api/v3", 1)[-1].split("/api", 1)[-1]
+                query = dict(urllib.parse.parse_qsl(parsed.query))
+                endpoint = path if not path.startswith("/command/") else "/command"
+                standin.library.count("sonarr {} {}".format(self.command, endpoint))
+                return path, query
+
+            def do_GET(self):
+                path, query = self.route()
+                if path == "/media":
+                    self.send_response(200)
+                    self.send_header("Content-Type", "video/mp4")
+                    self.send_header("Content-Length", "1024")
+                    self.end_headers()
+                    self.wfile.write(b"\0" * 1024)
+                    return
+                body = standin.get(path, query)
+                if body is None:
+                    self.respond(404, {"message": "NotFound"})
+                else:
+                    self.respond(200, body)
+
+            def do_POST(self):
+                path, _ = self.route()
+                length = int(self.headers.get("Content-Length", 0))
+                command = json.loads(self.rfile.read(length) or b"{}")
+                command.update({"id": len(standin.commands) + 1, "status": "completed"})
+                standin.commands[command["id"]] = command
+                self.respond(201, command)
+
+        return Handler
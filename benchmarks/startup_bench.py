@@ -0,0 +1,129 @@
+"""Startup benchmark of one-shot invocations.
+
+Starts fresh interpreters and reports the wall time and peak RSS of each
+startup step: importing sonarr_youtubedl, loading config.yml into a
+SonarrYTDL, and creating the first YoutubeDL, which is when yt-dlp and its
+extractors are loaded. A scan that finds nothing to search stops before that
+last step. Plain ``import yt_dlp`` is measured alongside for comparison.
+
+    python benchmarks/startup_bench.py --runs 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+import yaml
+
+APP = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "app"))
+
+# runs in the child interpreter, prints one JSON object of step measurements
+CHILD = """
+import json, resource, sys, time
+
+start = time.perf_counter()
+steps = []
+
+
+def step(name):
+    steps.append(
+        {
+            "step": name,
+            "seconds": time.perf_counter() - start,
+            "rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "yt_dlp": "yt_dlp" in sys.modules,
+        }
+    )
+
+
+step("interpreter")
+if sys.argv[1] == "yt_dlp":
+    import yt_dlp
+
+    step("import yt_dlp")
+else:
+    sys.path.insert(0, sys.argv[2])
+    import sonarr_youtubedl
+
+    step("import sonarr_youtubedl")
+    client = sonarr_youtubedl.SonarrYTDL()
+    step("load config")
+    client.new_ytdl({"quiet": True})
+    step("first YoutubeDL")
+print(json.dumps(steps))
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="interpreters per target")
+    return parser.parse_args()
+
+
+def write_config(path):
+    cfg = {
+        "sonarrytdl": {"scan_interval": "60", "debug": "False"},
+        "sonarr": {
+            "host": "127.0.0.1",
+            "port": "8989",
+            "apikey": "bench",
+            "ssl": "false",
+            "version": "v4",
+        },
+        "ytdl": {"default_format": "best"},
+        "series": [{"title": "Bench", "url": "https://www.youtube.com/@bench"}],
+    }
+    with open(path, "w") as ymlfile:
+        yaml.safe_dump(cfg, ymlfile)
+
+
+def measure(target, runs, env):
+    """Returns the steps of ``target`` with the median of each measurement"""
+    results = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", CHILD, target, APP],
+            env=env,
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout
+        results.append(json.loads(output.splitlines()[-1]))
+    steps = []
+    for i, first in enumerate(results[0]):
+        steps.append(
+            {
+                "step": first["step"],
+                "seconds": statistics.median(r[i]["seconds"] for r in results),
+                "rss": statistics.median(r[i]["rss"] for r in results),
+                "yt_dlp": first["yt_dlp"],
+            }
+        )
+    return steps
+
+
+def main():
+    options = parse_args()
+    workdir = tempfile.mkdtemp(prefix="sonarr_youtubedl_startup_")
+    env = dict(os.environ, CONFIGPATH=os.path.join(workdir, "config.yml"))
+    write_config(env["CONFIGPATH"])
+    print("median of {} interpreters per target".format(options.runs))
+    print("{:<26} {:>10} {:>10} {:>8}".format("step", "total ms", "RSS MiB", "yt_dlp"))
+    for target in ["sonarr_youtubedl", "yt_dlp"]:
+        for step in measure(target, options.runs, env):
+            print(
+                "{:<26} {:>10.1f} {:>10.1f} {:>8}".format(
+                    step["step"],
+                    step["seconds"] * 1000,
+                    step["rss"] / 1024,
+                    "loaded" if step["yt_dlp"] else "-",
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+import yaml
+
+# the app modules import each other as top level modules, like in the image
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+
+@pytest.fixture
+def config_file(tmp_path):
+    """Returns a function writing a config.yml to ``tmp_path`` with the given
+    sections added, returning its path"""
+
+    def write(**sections):
+        cfg = {
+            "sonarrytdl": {"scan_interval": "1", "debug": "False"},
+            "sonarr": {
+                "host": "127.0.0.1",
+                "port": "8989",
+                "apikey": "test",
+                "ssl": "false",
+            },
+            "ytdl": {"default_format": "best"},
+            "series": [{"title": "Show", "url": "https://www.youtube.com/@show"}],
+        }
+        cfg.update(sections)
+        path = tmp_path / "config.yml"
+        path.write_text(yaml.safe_dump(cfg))
+        return str(path)
+
+    return write
@@ -0,0 +1,31 @@
+import pytest
+from sonarr_youtubedl import SonarrYTDL
+
+
+def test_ratelimit_is_applied(config_file):
+    client = SonarrYTDL(
+        config_file(
+            ratelimit={
+                "requests_per_minute": "20",
+                "hosts": {"www.youtube.com": {"requests_per_minute": "10"}},
+            }
+        )
+    )
+    assert client.governor.rate == 20
+    assert client.governor.budget("host", "youtube.com") == (10, 5)
+    client.close()
+
+
+@pytest.mark.parametrize(
+    "ratelimit",
+    [
+        {"requests_per_minute": "0"},
+        {"requests_per_minute": "-5"},
+        {"hosts": {"youtube.com": {"requests_per_minute": "0"}}},
+        {"cookies": {"cookies.txt": {"requests_per_minute": "-1"}}},
+    ],
+)
+def test_ratelimit_of_0_or_less_is_rejected(config_file, ratelimit):
+    with pytest.raises(SystemExit) as exited:
+        SonarrYTDL(config_file(ratelimit=ratelimit))
+    assert "requests_per_minute" in str(exited.value)
@@ -0,0 +1,55 @@
+from leasequeue import LeaseQueue
+
+
+def queue(tmp_path):
+    return LeaseQueue(str(tmp_path / "queue.db"), lease_seconds=300)
+
+
+def test_complete_removes_the_task(tmp_path):
+    tasks = queue(tmp_path)
+    tasks.put("", 1, "Show", {"episodes": [1]})
+    tasks.complete(tasks.lease("worker"))
+    assert tasks.lease("worker") is None
+
+
+def test_put_while_leased_is_queued_after_complete(tmp_path):
+    tasks = queue(tmp_path)
+    tasks.put("", 1, "Show", {"episodes": [1]})
+    task = tasks.lease("worker")
+    tasks.put("", 1, "Show", {"episodes": [1, 2]})
+    assert tasks.lease("other") is None
+    tasks.complete(task)
+    task = tasks.lease("other")
+    assert task["payload"] == {"episodes": [1, 2]}
+    tasks.complete(task)
+    assert tasks.lease("worker") is None
+
+
+def test_put_while_leased_is_queued_after_release(tmp_path):
+    tasks = queue(tmp_path)
+    tasks.put("", 1, "Show", {"episodes": [1]})
+    task = tasks.lease("worker")
+    tasks.put("", 1, "Show", {"episodes": [1, 2]})
+    tasks.release(task)
+    assert tasks.lease("other")["payload"] == {"episodes": [1, 2]}
+
+
+def test_discard_while_leased_drops_the_put(tmp_path):
+    tasks = queue(tmp_path)
+    tasks.put("", 1, "Show", {"episodes": [1]})
+    task = tasks.lease("worker")
+    tasks.put("", 1, "Show", {"episodes": [1, 2]})
+    tasks.discard("", 1)
+    tasks.complete(task)
+    assert tasks.lease("worker") is None
+
+
+def test_expired_lease_is_taken_over_with_the_put(tmp_path):
+    tasks = queue(tmp_path)
+    tasks.put("", 1, "Show", {"episodes": [1]})
+    tasks.lease("worker")
+    tasks.put("", 1, "Show", {"episodes": [1, 2]})
+    tasks.execute("UPDATE tasks SET lease_expires = 0")
+    task = tasks.lease("other")
+    assert task["payload"] == {"episodes": [1, 2]}
+    assert "pending_payload" not in task
@@ -0,0 +1,83 @@
+import time
+
+import jobstore
+import pytest
+from models import Series, WantedEpisode
+from sonarr_youtubedl import SonarrYTDL
+
+
+@pytest.fixture
+def client(config_file, tmp_path, monkeypatch):
+    client = SonarrYTDL(
+        config_file(
+            sonarrytdl={"scan_interval": "1", "debug": "False", "import_grace": "60"}
+        )
+    )
+    monkeypatch.setattr(
+        client,
+        "get_episode_filename",
+        lambda ser, eps: str(tmp_path / "{}.%(ext)s".format(eps.title)),
+    )
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def series(client):
+    instance = next(iter(client.instances.values()))
+    options = client.get_series_options("Show", instance)
+    return Series(1, "Show", "/show", True, options, instance)
+
+
+def wanted(series, *titles):
+    return {
+        series.key: [
+            WantedEpisode(i, series.id, title, 1, i)
+            for i, title in enumerate(titles, 1)
+        ]
+    }
+
+
+def downloaded(series, eps, ago):
+    jobs = series.instance.jobs
+    jobs.matched(series, eps, "https://www.youtube.com/watch?v={}".format(eps.id))
+    jobs.set_state(series.id, eps.id, jobstore.DOWNLOADED)
+    jobs.execute(
+        "UPDATE jobs SET updated = ? WHERE episode_id = ?", (time.time() - ago, eps.id)
+    )
+
+
+def test_recent_download_waiting_for_import_is_skipped(client, series, tmp_path):
+    episodes = wanted(series, "Pilot")
+    (tmp_path / "Pilot.mkv").write_bytes(b"")
+    downloaded(series, episodes[series.key][0], 60)
+    client.skip_present([series], episodes)
+    assert episodes[series.key] == []
+
+
+def test_stale_file_without_a_download_is_searched(client, series, tmp_path):
+    episodes = wanted(series, "Pilot")
+    (tmp_path / "Pilot.mkv").write_bytes(b"")
+    client.skip_present([series], episodes)
+    assert [eps.title for eps in episodes[series.key]] == ["Pilot"]
+    assert (tmp_path / "Pilot.mkv").exists()
+
+
+def test_download_not_imported_in_time_is_downloaded_again(client, series, tmp_path):
+    episodes = wanted(series, "Pilot")
+    (tmp_path / "Pilot.mkv").write_bytes(b"")
+    downloaded(series, episodes[series.key][0], 2 * 60 * 60)
+    client.skip_present([series], episodes)
+    assert [eps.title for eps in episodes[series.key]] == ["Pilot"]
+    assert not (tmp_path / "Pilot.mkv").exists()
+
+
+def test_unfinished_download_is_resumed(client, series, tmp_path):
+    episodes = wanted(series, "Pilot", "Finale")
+    (tmp_path / "Pilot.webm").write_bytes(b"")
+    (tmp_path / "Finale.mkv").write_bytes(b"")
+    pilot, finale = episodes[series.key]
+    downloaded(series, pilot, 60)
+    series.instance.jobs.matched(series, finale, "https://www.youtube.com/watch?v=2")
+    client.skip_present([series], episodes)
+    assert [eps.title for eps in episodes[series.key]] == ["Pilot", "Finale"]
@@ -0,0 +1,44 @@
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+from webhook import WebhookServer
+
+
+@pytest.fixture
+def webhook():
+    server = WebhookServer("127.0.0.1", 0)
+    server.start()
+    yield server
+    server.stop()
+
+
+def post(webhook, payload):
+    request = urllib.request.Request(
+        "http://127.0.0.1:{}/webhook".format(webhook.server.server_address[1]),
+        data=json.dumps(payload).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def test_series_event_is_queued(webhook):
+    payload = {"eventType": "Grab", "series": {"id": 7, "title": "Show"}}
+    assert post(webhook, payload) == 202
+    assert webhook.wait(1, debounce=0) == {(None, 7)}
+
+
+def test_json_list_is_rejected(webhook):
+    assert post(webhook, [{"eventType": "Grab", "series": {"id": 7}}]) == 400
+    assert webhook.events.empty()
+
+
+def test_series_not_an_object_is_rejected(webhook):
+    assert post(webhook, {"eventType": "Grab", "series": [7]}) == 400
+    assert webhook.events.empty()